@@ -53,6 +53,7 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount',
     'allauth.socialaccount.providers.google',
+    'rest_framework',
     
     # Local
     'storefront.apps.StorefrontConfig',
@@ -66,6 +67,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'storefront.middleware.CartCountMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -169,3 +171,21 @@ LOGOUT_REDIRECT_URL = 'home'
 ACCOUNT_DEFAULT_HTTP_PROTOCOL='https'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Seconds between checks of the CacheVersion counters of data kept in memory
+# (recipes, catalog, ...). Changes made in the same process are seen immediately.
+CACHE_VERSION_TTL = 5
+
+# Maximum size in bytes of the analytics reports cached by each process. The least
+# recently used reports are evicted first (see storefront/reports.py).
+REPORT_CACHE_BYTES = 32 * 1024 * 1024
+
+# The JSON API (storefront/api.py) is read-only and, like the analytics pages, staff only
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAdminUser'],
+}
+
+# Seconds a rendered menu page is kept in the cache. Pages are keyed by the catalog
+# version, so this only bounds how long unused pages take space (see storefront/pagecache.py).
+PAGE_CACHE_SECONDS = 60 * 60
@@ -60,6 +60,7 @@ django.setup()
 
 
 from storefront.models import *
+from django.utils import timezone
 import re # Regex
 import csv # CSV/TSV File parsing
 import random
@@ -191,7 +192,10 @@ if create_random_orders:
         num_orders = random.randint(min_order_per_day, max_order_per_day)
         print(f"For day {day}: {num_orders} orders")
 
-        orders = [Order(cashier='randomly generated', date=day.date()) for i in range(num_orders)]
+        # Orders are spread randomly over the opening hours, 7am to 9pm
+        orders = [Order(cashier='randomly generated', date=day.date(),
+                        placed=timezone.make_aware(day + datetime.timedelta(seconds=random.randint(7*3600, 21*3600))))
+                  for i in range(num_orders)]
         order_amts = [( # Generate Order Helper Amounts
                 num_items, #                                                                            number of items for this order
                 random.choices(range(min_amt_per_item, max_amt_per_item+1), k=num_items), #             amt of each orderItem
@@ -228,10 +232,7 @@ if create_random_orders:
         ItemCustomization.objects.bulk_create(itemcusts_flat, ignore_conflicts=True)
 
         print("All orders created. Checking out")
-        for i, o in enumerate(orders):
-            print(f"Order {i} / {len(orders)}")
-            o.checkout()
-            print("\033[1F\033[0J", end='')
+        Order.checkout_many(orders)
 
         print("\033[2F\033[J", end='')
     print("All orders successfully created and checked out")    
@@ -7,7 +7,8 @@ from .models import (
     Finance, 
     Inventory, 
     Menu,
-    Ingredient
+    Ingredient,
+    CheckoutTask
 )
 class IngredientInline(admin.TabularInline):
     model = Ingredient
@@ -31,6 +32,10 @@ class IngredientAdmin(admin.ModelAdmin):
 class CustomizationAdmin(admin.ModelAdmin):
     search_fields = ['id', 'name__icontains', 'type__iexact']
 
+class CheckoutTaskAdmin(admin.ModelAdmin):
+    list_display = ['order', 'created', 'attempts', 'done', 'error']
+    list_filter = ['done']
+
 # Register your models here.
 admin.site.register(Customization, CustomizationAdmin)
 admin.site.register(Order)
@@ -39,4 +44,5 @@ admin.site.register(Finance)
 admin.site.register(Inventory, InventoryAdmin)
 admin.site.register(Menu, MenuAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(CheckoutTask, CheckoutTaskAdmin)
 
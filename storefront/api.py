@@ -0,0 +1,223 @@
+import base64
+import datetime
+import hashlib
+import json
+from collections import namedtuple
+
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from .models import Finance, FinanceView
+from .reports import getReportCache
+
+##
+# @brief A report which can be fetched from the API
+#
+# params is a dictionary of the GET parameters of the report and their
+# (type, default), build is a function taking the FinanceView and the parsed
+# parameters and returning a list of dictionaries, key is a function taking the
+# parsed parameters and returning the columns which identify a row, dated is
+# whether the report needs start_date and end_date, and versions are the
+# CacheVersion counters the report depends on.
+ApiReport = namedtuple('ApiReport', ['params', 'build', 'key', 'dated', 'versions'])
+
+def _inventoryRows(qset, *columns):
+    return list(qset.values('id', 'name', *columns))
+
+REPORTS = {
+    'sales': ApiReport(
+        {'group': (str, 'item')},
+        lambda f, p: list(f.salesReport(p['group'])),
+        lambda p: list(FinanceView.SALES_GROUPS[p['group']]), True, ()),
+    'excess': ApiReport(
+        {'pct': (float, 0.1)},
+        lambda f, p: _inventoryRows(f.excessReport(p['pct']), 'stock', 'stock_used', 'percent_usage'),
+        lambda p: ['id'], True, ('recipes',)),
+    'restock': ApiReport(
+        {'min_units': (int, 100)},
+        lambda f, p: _inventoryRows(f.restockReport(p['min_units']), 'stock', 'amount_per_unit', 'num_units'),
+        lambda p: ['id'], False, ('recipes',)),
+    'usage': ApiReport(
+        {},
+        lambda f, p: _inventoryRows(f.getInventoryUsage(), 'stock_used'),
+        lambda p: ['id'], True, ()),
+    'frequent': ApiReport(
+        {'top': (int, None)},
+        lambda f, p: [pair._asdict() for pair in f.sellsTogetherReport(p['top'])],
+        lambda p: ['item_a_name', 'item_b_name'], True, ()),
+    'itemsets': ApiReport(
+        {'min_support': (float, 0.01), 'min_size': (int, 1), 'max_size': (int, None)},
+        lambda f, p: [{'items': list(items), 'orders': orders, 'support': support} for items, orders, support
+                      in f.frequentItemsets(p['min_support'], p['min_size'], p['max_size'])],
+        lambda p: ['items'], True, ()),
+    'forecast': ApiReport(
+        {'window': (int, 28), 'lead_days': (int, 7), 'cover_days': (int, 14)},
+        lambda f, p: f.forecastReport(p['window'], p['lead_days'], p['cover_days']),
+        lambda p: ['id'], True, ('recipes',)),
+    'series': ApiReport(
+        {'bucket': (str, 'day')},
+        lambda f, p: f.salesSeries(p['bucket']),
+        lambda p: ['bucket'], True, ()),
+}
+
+## The number of rows in a page when no limit is given, and the largest limit allowed
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+##
+# @brief An error in the parameters of a request, which is returned as a 400 response
+class ApiError(Exception):
+    pass
+
+def _date(data, name):
+    try:
+        return datetime.date.fromisoformat(data[name])
+    except KeyError:
+        raise ApiError(f"{name} is required")
+    except ValueError:
+        raise ApiError(f"{name} must be a date in the form YYYY-MM-DD")
+
+def _params(report, data):
+    params = dict()
+    for name, (type, default) in report.params.items():
+        try:
+            params[name] = type(data[name]) if data.get(name, '') != '' else default
+        except ValueError:
+            raise ApiError(f"{name} must be a {type.__name__}")
+    return params
+
+def _limit(data):
+    try:
+        return min(max(int(data.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ApiError("limit must be an int")
+
+def _fields(data):
+    fields = data.get('fields')
+    return [f for f in fields.split(',') if f] if fields else None
+
+##
+# @brief Encode the key of the last row of a page as an opaque cursor
+def encodeCursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode()
+
+##
+# @brief Decode a cursor returned by encodeCursor
+def decodeCursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ApiError("cursor is not valid")
+
+def _etag(*parts):
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+##
+# @brief Build a page of rows, or a 304 response if the client has the page already
+#
+# @param request The request
+# @param etag The ETag of the page, which must change whenever the page changes
+# @param rows A function taking no arguments which returns the rows of the page,
+# and the cursor of the next page or None. It may raise an ApiError.
+# @return A Response
+def _page(request, etag, rows):
+    if etag in request.headers.get('If-None-Match', '').split(', '):
+        return Response(status=304, headers={'ETag': etag})
+
+    try:
+        results, cursor = rows()
+    except ApiError as e:
+        return _error(e)
+
+    fields = _fields(request.GET)
+    if fields is not None:
+        results = [{f: row[f] for f in fields if f in row} for row in results]
+
+    next_url = None
+    if cursor is not None:
+        query = request.GET.copy()
+        query['cursor'] = cursor
+        next_url = request.build_absolute_uri('?' + query.urlencode())
+
+    return Response({'results': results, 'next': next_url}, headers={'ETag': etag})
+
+def _error(error):
+    return Response({'detail': str(error)}, status=400)
+
+##
+# @brief The daily Finance rows of a range of days
+#
+# GET parameters: start_date, end_date, limit, cursor and fields (a comma separated
+# list of the columns to return). The rows are paginated by date, so every page
+# is an index range scan no matter how deep it is.
+@api_view(['GET'])
+def finances(request):
+    data = request.GET
+    try:
+        start = _date(data, 'start_date')
+        end = _date(data, 'end_date')
+        limit = _limit(data)
+        after = datetime.date.fromisoformat(str(decodeCursor(data['cursor']))) if 'cursor' in data else None
+    except ValueError:
+        return _error(ApiError("cursor is not valid"))
+    except ApiError as e:
+        return _error(e)
+
+    def rows():
+        qset = Finance.objects.filter(date__gte=start, date__lte=end).order_by('date')
+        if after is not None:
+            qset = qset.filter(date__gt=after)
+        results = list(qset.values('date', 'revenue', 'expenses', 'profit')[:limit + 1])
+        cursor = encodeCursor(str(results[limit - 1]['date'])) if len(results) > limit else None
+        return results[:limit], cursor
+
+    stamp = getReportCache().stamp(start, end)
+    return _page(request, _etag('finances', start, end, stamp, after, limit, data.get('fields')), rows)
+
+##
+# @brief A FinanceView report
+#
+# GET parameters: start_date and end_date (except for restock), the parameters of
+# the report (see REPORTS), limit, cursor and fields. The report is built once
+# through the ReportCache and then paged by the key of the last row returned.
+# The ETag only depends on the revisions of the days in the report, so it can be
+# checked without building the report.
+@api_view(['GET'])
+def report(request, pk):
+    if pk not in REPORTS:
+        return Response({'detail': f"No report named {pk}"}, status=404)
+
+    definition = REPORTS[pk]
+    data = request.GET
+    try:
+        start = _date(data, 'start_date') if definition.dated else None
+        end = _date(data, 'end_date') if definition.dated else None
+        params = _params(definition, data)
+        limit = _limit(data)
+        after = decodeCursor(data['cursor']) if 'cursor' in data else None
+        if pk == 'sales' and params['group'] not in FinanceView.SALES_GROUPS:
+            raise ApiError("group must be one of " + ", ".join(FinanceView.SALES_GROUPS))
+        if pk == 'series' and params['bucket'] not in FinanceView.BUCKETS:
+            raise ApiError("bucket must be one of " + ", ".join(FinanceView.BUCKETS))
+    except ApiError as e:
+        return _error(e)
+
+    key = definition.key(params)
+    finances = FinanceView(start or datetime.date.today(), end or datetime.date.today())
+
+    def rows():
+        results = getReportCache().get('api:' + pk, tuple(params.values()), start, end,
+                                       lambda: definition.build(finances, params), definition.versions)
+        offset = 0
+        if after is not None:
+            keys = [json.loads(json.dumps([row[k] for k in key], default=str)) for row in results]
+            if after not in keys:
+                raise ApiError("cursor is no longer valid, the report has changed")
+            offset = keys.index(after) + 1
+
+        page = results[offset:offset + limit]
+        more = offset + limit < len(results)
+        return page, encodeCursor([page[-1][k] for k in key]) if more else None
+
+    stamp = getReportCache().stamp(start, end, definition.versions)
+    return _page(request, _etag(pk, params, start, end, stamp, after, limit, data.get('fields')), rows)
@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+
+from cachetools import LRUCache
+from django.utils import timezone
+
+from .models import OrderItem, deltaDate
+
+##
+# @brief A node of an FPTree
+class FPNode():
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = dict()
+
+##
+# @brief A frequent-pattern tree of integer-encoded baskets
+#
+# Every basket is inserted as a path from the root, with its items in a fixed rank
+# order, so that baskets sharing their most common items share a prefix. Frequent
+# itemsets are mined from the tree with FP-growth. Baskets can be inserted at any
+# time, which is what lets BasketMiner add new orders without rebuilding.
+class FPTree():
+
+    ##
+    # @brief Create an empty tree
+    #
+    # @param rank A dictionary of the rank of each item. Items not in it are ranked
+    # after every item in it, in the order that they are first inserted.
+    def __init__(self, rank=None):
+        self.root = FPNode(None, None)
+        self.rank = dict(rank or dict())
+        ## The nodes of each item, used to find the paths which contain it
+        self.header = dict()
+        ## The number of baskets which contain each item
+        self.support = dict()
+        ## The number of baskets inserted
+        self.baskets = 0
+
+    ##
+    # @brief Insert a basket into the tree
+    #
+    # @param items An iterable of the distinct integer items in the basket
+    # @param count The number of times to insert the basket
+    def insert(self, items, count=1):
+        for item in items:
+            self.rank.setdefault(item, len(self.rank))
+
+        node = self.root
+        for item in sorted(items, key=self.rank.__getitem__):
+            child = node.children.get(item)
+            if child is None:
+                child = node.children[item] = FPNode(item, node)
+                self.header.setdefault(item, list()).append(child)
+            child.count += count
+            self.support[item] = self.support.get(item, 0) + count
+            node = child
+
+        self.baskets += count
+
+    ##
+    # @brief Build the conditional tree of the baskets containing an item
+    #
+    # The prefix path of every node of the item is inserted, with the count of the
+    # node, keeping only the items which are frequent within those paths.
+    #
+    # @param item The item to condition on
+    # @param min_count The minimum support of the items to keep
+    # @return A new FPTree
+    def conditional(self, item, min_count):
+        paths = list()
+        support = dict()
+        for node in self.header.get(item, ()):
+            path = list()
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                support[parent.item] = support.get(parent.item, 0) + node.count
+                parent = parent.parent
+            paths.append((path, node.count))
+
+        tree = FPTree(self.rank)
+        for path, count in paths:
+            tree.insert([i for i in path if support[i] >= min_count], count)
+        return tree
+
+    ##
+    # @brief Mine the frequent itemsets of the tree with FP-growth
+    #
+    # @param min_count The minimum number of baskets an itemset must be in
+    # @param max_size The largest itemsets to return, or None for any size
+    # @param suffix The items that every itemset of this tree is conditioned on
+    # @return A generator of (frozenset of items, support) tuples
+    def mine(self, min_count, max_size=None, suffix=()):
+        # Least frequent items first, so their conditional trees are small
+        for item in sorted(self.support, key=lambda i: (self.support[i], -self.rank[i])):
+            support = self.support[item]
+            if support < min_count:
+                continue
+
+            itemset = suffix + (item,)
+            yield frozenset(itemset), support
+
+            if max_size is None or len(itemset) < max_size:
+                yield from self.conditional(item, min_count).mine(min_count, max_size, itemset)
+
+##
+# @brief Frequent itemsets of the orders placed in a range of days
+#
+# The Menu items of each order are encoded as small integers, by name, so that the
+# sizes of a drink count as the same item (the same as SalesPair). The baskets are
+# inserted into an FPTree once, and orders placed after that are added to the tree
+# by update(), which only reads orders newer than the newest one already added.
+#
+# Use getMiner() to get the cached miner of a range instead of creating this class.
+class BasketMiner():
+
+    ##
+    # @brief Create an empty miner for a range of days
+    #
+    # @param start The first day of the range
+    # @param end The last day of the range, inclusive
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.names = list()
+        self.codes = dict()
+        self.tree = None
+        self.last_order = 0
+        self.built = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _encode(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def _baskets(self, after):
+        items = OrderItem.objects.filter(order__date__gte=self.start, order__date__lte=self.end,
+                                         order__gt=after).order_by('order').values_list('order', 'menu_item__name')
+
+        baskets = dict()
+        for order, name in items.iterator(chunk_size=5000):
+            baskets.setdefault(order, set()).add(self._encode(name))
+        return baskets
+
+    ##
+    # @brief Build the tree from every order in the range
+    #
+    # The items are ranked by how many orders contain them, which keeps the tree small.
+    def build(self):
+        baskets = self._baskets(0)
+        support = dict()
+        for basket in baskets.values():
+            for item in basket:
+                support[item] = support.get(item, 0) + 1
+
+        rank = {item: r for r, item in enumerate(sorted(support, key=lambda i: (-support[i], i)))}
+        self.tree = FPTree(rank)
+        for basket in baskets.values():
+            self.tree.insert(basket)
+
+        self.last_order = max(baskets, default=0)
+        self.built = time.monotonic()
+
+    ##
+    # @brief Add the orders placed since the tree was built or last updated
+    def update(self):
+        baskets = self._baskets(self.last_order)
+        for basket in baskets.values():
+            self.tree.insert(basket)
+        self.last_order = max(baskets, default=self.last_order)
+
+    ##
+    # @brief Get the frequent itemsets of the range
+    #
+    # @param min_support The minimum fraction of orders (0 < min_support <= 1) an itemset must be in
+    # @param min_size The smallest itemsets to return, e.g. 2 for only pairs and larger
+    # @param max_size The largest itemsets to return, or None for any size
+    # @return A list of (tuple of Menu item names, number of orders, fraction of orders)
+    # tuples, sorted by the number of orders
+    def itemsets(self, min_support=0.01, min_size=1, max_size=None):
+        with self.lock:
+            baskets = self.tree.baskets
+            if baskets == 0:
+                return list()
+
+            min_count = max(1, math.ceil(min_support * baskets))
+            found = [(tuple(sorted(self.names[i] for i in itemset)), count, count / baskets)
+                     for itemset, count in self.tree.mine(min_count, max_size)
+                     if len(itemset) >= min_size]
+
+        found.sort(key=lambda row: (-row[1], len(row[0]), row[0]))
+        return found
+
+
+## Seconds before a cached miner is rebuilt from scratch instead of updated
+REBUILD_SECONDS = 3600
+
+miners = LRUCache(maxsize=16)
+miners_lock = threading.Lock()
+
+##
+# @brief Get the miner of a range of days, with every order in the range added
+#
+# Miners are cached per range. A cached miner of a range which includes a recent
+# day reads only the orders placed since its last update. Miners are rebuilt
+# from scratch every REBUILD_SECONDS, so that orders which were committed out of
+# order are not missed for long.
+#
+# @param start The first day of the range
+# @param end The last day of the range, inclusive
+# @return A BasketMiner
+def getMiner(start, end):
+    with miners_lock:
+        miner = miners.get((start, end))
+        if miner is None:
+            miner = miners[(start, end)] = BasketMiner(start, end)
+
+    with miner.lock:
+        if miner.tree is None or time.monotonic() - miner.built >= REBUILD_SECONDS:
+            miner.build()
+        elif end >= deltaDate(timezone.localdate(), -1):
+            miner.update()
+
+    return miner
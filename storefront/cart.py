@@ -0,0 +1,213 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import getCatalog
+from .models import ItemCustomization, Order, OrderItem
+from .pricing import getPricing
+
+##
+# @brief A shopping cart which is kept in the session
+#
+# The items in the cart, and the item that the customer is currently
+# configuring, are stored in the session as compact lists of the form
+# [menu id, amount, [[customization id, amount], ...]]. Browsing and
+# configuring items never writes to the DB. The cart is only written when
+# it is checked out, as an Order with its OrderItems and ItemCustomizations,
+# in a single transaction.
+class Cart():
+
+    ## Session key of the list of items in the cart
+    ITEMS_KEY = 'cart-items'
+
+    ## Session key of the item being configured
+    VIEW_KEY = 'cart-view'
+
+    ## Cookie with the number of items in the cart, which the header shows (see CartCountMiddleware)
+    COUNT_COOKIE = 'cart-count'
+
+    ##
+    # @brief Get the cart of a session
+    #
+    # @param session The session of the request, i.e. request.session
+    def __init__(self, session):
+        self.session = session
+        items = session.get(self.ITEMS_KEY)
+        self.items = items if isinstance(items, list) else list()
+
+    def __len__(self):
+        return len(self.items)
+
+    ##
+    # @brief Mark the session as changed after the cart is changed in place
+    def save(self):
+        self.session[self.ITEMS_KEY] = self.items
+        self.session.modified = True
+
+    ##
+    # @brief Get the item being configured
+    #
+    # @return The item as [menu id, amount, customizations], or None
+    def getView(self):
+        return self.session.get(self.VIEW_KEY)
+
+    ##
+    # @brief Start configuring a new item
+    #
+    # @param menu_item The Menu item id of the new item
+    # @param amount The amount of the item
+    def setView(self, menu_item, amount=1):
+        self.session[self.VIEW_KEY] = [menu_item, amount, list()]
+
+    ##
+    # @brief Change the Menu item (e.g. the size) and amount of the item being configured
+    #
+    # @param menu_item The new Menu item id
+    # @param amount The new amount
+    def updateView(self, menu_item, amount):
+        view = self.getView()
+        view[0] = menu_item
+        view[1] = amount
+        self.save()
+
+    ##
+    # @brief Replace the whole configuration of the item being configured
+    #
+    # @param menu_item The Menu item id
+    # @param amount The amount of the item
+    # @param custs An iterable of (Customization id, amount) tuples. Repeated
+    # Customizations are merged.
+    def configureView(self, menu_item, amount, custs):
+        merged = dict()
+        for cust, n in custs:
+            merged[cust] = merged.get(cust, 0) + int(n)
+        self.session[self.VIEW_KEY] = [menu_item, amount, [[cust, n] for cust, n in merged.items()]]
+
+    ##
+    # @brief Stop configuring the item without adding it to the cart
+    def clearView(self):
+        self.session.pop(self.VIEW_KEY, None)
+
+    ##
+    # @brief Add the given amount of a Customization to the item being configured
+    #
+    # @param cust The Customization id
+    # @param amount The amount of the Customization to add
+    def addCustomization(self, cust, amount):
+        self.addCustomizations([(cust, amount)])
+
+    ##
+    # @brief Add several Customizations to the item being configured at once
+    #
+    # The amounts are merged into the item in one pass, and the session is only
+    # marked as changed once.
+    #
+    # @param custs An iterable of (Customization id, amount) tuples
+    def addCustomizations(self, custs):
+        current = self.getView()[2]
+        index = {pair[0]: pair for pair in current}
+        for cust, amount in custs:
+            if cust in index:
+                index[cust][1] += int(amount)
+            else:
+                index[cust] = [cust, int(amount)]
+                current.append(index[cust])
+        self.save()
+
+    ##
+    # @brief Move the item being configured into the cart
+    def addView(self):
+        if self.getView() is not None:
+            self.items.append(self.session.pop(self.VIEW_KEY))
+            self.save()
+
+    ##
+    # @brief Remove an item from the cart
+    #
+    # @param index The position of the item in the cart
+    def remove(self, index):
+        if 0 <= index < len(self.items):
+            del self.items[index]
+            self.save()
+
+    ##
+    # @brief Turn cart items into unsaved OrderItems, with their prices
+    #
+    # The OrderItems have the same 'price' and 'customization_list' attributes
+    # as the ones returned by Order.getTotals, so templates can show either.
+    # Items whose Menu item no longer exists are skipped. The catalog and the
+    # price list are reloaded separately, so only what is in both is used.
+    #
+    # @param items A list of cart items
+    # @return A list of unsaved OrderItems
+    def _lines(self, items):
+        pricing = getPricing()
+        catalog = getCatalog()
+        menu = catalog.menu
+        custs = catalog.customizations
+
+        lines = list()
+        for menu_item, amount, cust_list in items:
+            if menu_item not in menu or menu_item not in pricing.menu:
+                continue
+            cust_list = [(c, a) for c, a in cust_list if c in custs and c in pricing.customizations]
+
+            line = OrderItem(menu_item=menu[menu_item], amount=amount)
+            line.customization_list = [ItemCustomization(order_item=line, customization=custs[c], amount=a) for c, a in cust_list]
+            for cust, price in zip(line.customization_list, pricing.customizationPrices(cust_list)):
+                cust.price = price
+
+            line.price = round(pricing.itemPrice(menu_item, amount, cust_list), 2)
+            line.cost = line.price
+            lines.append(line)
+
+        return lines
+
+    ##
+    # @brief Get the priced item being configured
+    #
+    # @return An unsaved OrderItem, or None if no item is being configured
+    def getViewItem(self):
+        view = self.getView()
+        lines = self._lines([view]) if view is not None else list()
+        return lines[0] if len(lines) > 0 else None
+
+    ##
+    # @brief Calculate the price of each item and of the whole cart
+    #
+    # @return A tuple of the list of unsaved OrderItems and the total price
+    def getTotals(self):
+        lines = self._lines(self.items)
+        return lines, round(sum(line.price for line in lines), 2)
+
+    ##
+    # @brief Save the cart as an Order and place it
+    #
+    # The Order, its OrderItems and its ItemCustomizations are each created with
+    # a single bulk insert, in one transaction, and the Order is queued to be
+    # checked out. The cart is emptied.
+    #
+    # @param cashier The name of the cashier for the Order
+    # @return The new Order, or None if the cart was empty
+    def checkout(self, cashier):
+        lines, total = self.getTotals()
+        if len(lines) == 0:
+            return None
+
+        with transaction.atomic():
+            placed = timezone.now()
+            order = Order(cashier=cashier, date=timezone.localdate(placed), placed=placed, price=total)
+            order.save()
+
+            for line in lines:
+                line.order = order
+            OrderItem.objects.bulk_create(lines)
+
+            ItemCustomization.objects.bulk_create(
+                    [cust for line in lines for cust in line.customization_list])
+
+            order.place()
+
+        self.items.clear()
+        self.clearView()
+        self.save()
+        return order
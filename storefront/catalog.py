@@ -0,0 +1,152 @@
+from .models import Customization, Ingredient, Menu
+from .versioned import Versioned
+
+##
+# @brief In-memory snapshot of the Menu and the Customizations
+#
+# Holds every Menu item, grouped by id, by name and by type, the names of the
+# ingredients of each item, and every Customization by id, so that browsing the
+# menu issues no queries. The instances in the snapshot are shared by every
+# request of the process, so they must be treated as read-only and never saved.
+#
+# Use getCatalog() to get the current snapshot instead of creating this class.
+class Catalog():
+
+    ##
+    # @brief Create a snapshot
+    #
+    # @param items An iterable of Menu items
+    # @param customizations An iterable of Customizations
+    # @param ingredients A dictionary of Menu item ids and lists of the names of their ingredients
+    def __init__(self, items, customizations=(), ingredients=None):
+        ## Every Menu item, ordered by id
+        self.items = tuple(sorted(items, key=lambda item: item.pk))
+        self.menu = {item.pk: item for item in self.items}
+        self.customizations = {cust.pk: cust for cust in sorted(customizations, key=lambda cust: cust.pk)}
+        self.ingredients = {pk: tuple(names) for pk, names in (ingredients or dict()).items()}
+
+        ## The sizes of each drink, by name
+        self.names = dict()
+        ## The Menu items of each type, by lowercase type
+        self.types = dict()
+        for item in self.items:
+            self.names.setdefault(item.name, list()).append(item)
+            self.types.setdefault(item.type.lower(), list()).append(item)
+        self.names = {name: tuple(items) for name, items in self.names.items()}
+        self.types = {type: tuple(items) for type, items in self.types.items()}
+
+        ## The Customizations of each type, by lowercase type
+        self.customization_types = dict()
+        for cust in self.customizations.values():
+            self.customization_types.setdefault(cust.type.lower(), list()).append(cust)
+        self.customization_types = {type: tuple(custs) for type, custs in self.customization_types.items()}
+
+        ## The id of each Customization, by (lowercase type, name) and by (None, name).
+        # The first id wins when names are repeated.
+        self.customization_names = dict()
+        for cust in self.customizations.values():
+            self.customization_names.setdefault((cust.type.lower(), cust.name), cust.pk)
+            self.customization_names.setdefault((None, cust.name), cust.pk)
+
+    ##
+    # @brief Load the snapshot from the DB
+    #
+    # @return A new Catalog
+    @classmethod
+    def load(cls):
+        ingredients = dict()
+        for menu_item, name in Ingredient.objects.order_by('id').values_list('menu_item', 'inventory__name'):
+            ingredients.setdefault(menu_item, list()).append(name)
+
+        return cls(Menu.objects.all(), Customization.objects.all(), ingredients)
+
+    ##
+    # @brief Get a Menu item by id
+    #
+    # @param pk The id of the Menu item
+    # @return The Menu item, or None if it does not exist
+    def get(self, pk):
+        return self.menu.get(int(pk))
+
+    ##
+    # @brief Get one size of a drink
+    #
+    # @param name The name of the drink
+    # @param size The size, case insensitive
+    # @return The Menu item, or None if the drink does not come in that size
+    def item(self, name, size):
+        for item in self.names.get(name, ()):
+            if item.size.lower() == size.lower():
+                return item
+        return None
+
+    ##
+    # @brief Get the sizes of a drink, in the form used by CustomizationForm.setSizes
+    #
+    # @param name The name of the drink
+    # @return A list of 2-tuples of the size and the size
+    def sizes(self, name):
+        return [(item.size, item.size) for item in self.names.get(name, ())]
+
+    ##
+    # @brief Get the description of a drink, which is kept on its grande size
+    #
+    # @param name The name of the drink
+    # @return The description, or the description of any size if there is no grande
+    def description(self, name):
+        item = self.item(name, 'grande') or next(iter(self.names.get(name, ())), None)
+        return item.description if item is not None else ''
+
+    ##
+    # @brief Get the Menu items of a type
+    #
+    # @param type The type, case insensitive
+    # @param size Only return items of this size (case insensitive), or None for every size
+    # @return A list of Menu items, ordered by id
+    def ofType(self, type, size=None):
+        items = self.types.get(type.lower(), ())
+        return [item for item in items if size is None or item.size.lower() == size.lower()]
+
+    ##
+    # @brief Get the Customizations of a type
+    #
+    # @param type The type, case insensitive
+    # @return A tuple of Customizations, ordered by id
+    def customizationsOfType(self, type):
+        return self.customization_types.get(type.lower(), ())
+
+    ##
+    # @brief Resolve the names of Customizations to their ids
+    #
+    # @param names An iterable of Customization names
+    # @param type Only resolve Customizations of this type (case insensitive), or None for any type
+    # @return A dictionary of names and Customization ids. Names which do not
+    # exist are left out.
+    def customizationIds(self, names, type=None):
+        key = type.lower() if type is not None else None
+        return {name: self.customization_names[(key, name)] for name in names
+                if (key, name) in self.customization_names}
+
+
+catalog = Versioned('catalog', Catalog.load)
+
+##
+# @brief Get the current catalog snapshot
+#
+# The snapshot is loaded once per process and reloaded when a Menu item,
+# Customization, Ingredient or Inventory item changes.
+#
+# @return The current Catalog
+def getCatalog():
+    return catalog.get()
+
+##
+# @brief Get the version of the current catalog snapshot
+#
+# The version changes whenever the snapshot is reloaded, so it can be used to
+# key anything built from the catalog.
+#
+# @return The CacheVersion counter the snapshot was loaded at
+def getCatalogVersion():
+    catalog.get()
+    return catalog.version
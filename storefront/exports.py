@@ -0,0 +1,114 @@
+import csv
+import datetime
+import decimal
+
+import orjson
+
+from .models import FinanceView, InventoryUsage, OrderItem
+
+## Number of rows fetched from the server-side cursor at a time
+CHUNK_SIZE = 2000
+
+def _sales(data):
+    finances = FinanceView(data['start_date'], data['end_date'])
+    return finances.salesReport(data.get('group', 'item')).iterator(chunk_size=CHUNK_SIZE)
+
+def _excess(data):
+    finances = FinanceView(data['start_date'], data['end_date'])
+    return finances.excessReport(float(data.get('pct', 0.1))).values(
+            'id', 'name', 'stock', 'stock_used', 'percent_usage').iterator(chunk_size=CHUNK_SIZE)
+
+def _restock(data):
+    # The restock report only depends on the current stock
+    today = datetime.date.today()
+    finances = FinanceView(today, today)
+    return finances.restockReport(int(data.get('limit_amt', 100))).values(
+            'id', 'name', 'stock', 'amount_per_unit', 'num_units').iterator(chunk_size=CHUNK_SIZE)
+
+def _frequent(data):
+    finances = FinanceView(data['start_date'], data['end_date'])
+    limit = data.get('limit_amt')
+    pairs = finances.sellsTogetherReport(int(limit) if limit else None)
+    return (pair._asdict() for pair in pairs.iterator(chunk_size=CHUNK_SIZE))
+
+def _usage(data):
+    return InventoryUsage.objects.filter(date__gte=data['start_date'], date__lte=data['end_date']) \
+            .order_by('date', 'item').values('date', 'item', 'item__name', 'amount_used') \
+            .iterator(chunk_size=CHUNK_SIZE)
+
+def _orderitems(data):
+    return OrderItem.objects.filter(order__date__gte=data['start_date'], order__date__lte=data['end_date']) \
+            .order_by('order', 'id').values('id', 'order', 'order__date', 'menu_item', 'menu_item__name',
+                                            'menu_item__size', 'amount', 'cost') \
+            .iterator(chunk_size=CHUNK_SIZE)
+
+##
+# @brief The columns and rows of each export
+#
+# Each export is a list of columns (None if they depend on the parameters) and a
+# function taking the GET parameters of the request and returning an iterator of
+# dictionaries, one per row. The rows are read with .iterator(), so they are 
+# streamed from a server-side cursor instead of being loaded into memory.
+EXPORTS = {
+    'sales': (None, _sales),
+    'excess': (['id', 'name', 'stock', 'stock_used', 'percent_usage'], _excess),
+    'restock': (['id', 'name', 'stock', 'amount_per_unit', 'num_units'], _restock),
+    'frequent': (['item_a_name', 'item_b_name', 'total', 'item_a_image', 'item_b_image'], _frequent),
+    'usage': (['date', 'item', 'item__name', 'amount_used'], _usage),
+    'orderitems': (['id', 'order', 'order__date', 'menu_item', 'menu_item__name', 'menu_item__size',
+                    'amount', 'cost'], _orderitems),
+}
+
+##
+# @brief Get the columns of an export
+#
+# @param name The name of the export
+# @param data The GET parameters of the request
+# @return The list of column names
+def columns(name, data):
+    cols = EXPORTS[name][0]
+    if cols is None:
+        group = data.get('group', 'item')
+        cols = list(FinanceView.SALES_GROUPS[group]) + (['image'] if group == 'name' else []) + ['units', 'revenue', 'orders']
+    return cols
+
+##
+# @brief Get an iterator of the rows of an export
+#
+# @param name The name of the export, one of EXPORTS
+# @param data The GET parameters of the request
+# @return An iterator of dictionaries
+def rows(name, data):
+    return EXPORTS[name][1](data)
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError
+
+##
+# @brief Serialize rows as newline delimited JSON
+#
+# @param rows An iterator of dictionaries
+# @return A generator of bytes, one line per row
+def ndjson(rows):
+    for row in rows:
+        yield orjson.dumps(row, default=_default, option=orjson.OPT_APPEND_NEWLINE)
+
+##
+# @brief A file-like object which returns what is written to it, for csv.writer
+class _Echo():
+    def write(self, value):
+        return value
+
+##
+# @brief Serialize rows as CSV, with a header row
+#
+# @param columns The column names, in order
+# @param rows An iterator of dictionaries
+# @return A generator of strings, one line per row
+def csvLines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row.get(col) for col in columns])
@@ -0,0 +1,146 @@
+import numpy as np
+
+from .models import Inventory, InventoryUsage
+
+##
+# @brief Stock-out forecast of every Inventory item, from its InventoryUsage history
+#
+# The history is held as a Days x Inventory matrix of the grams used each day. The
+# burn rate of each item is the rolling mean of its usage over the last `window`
+# days, and it is scaled by a weekday factor (how much more or less of the item
+# is used on that day of the week than on average) to project the usage of each
+# future day. Every item is computed at once with NumPy.
+#
+# Use StockForecast.load() to build the forecast from the DB.
+class StockForecast():
+
+    ##
+    # @brief Create a forecast
+    #
+    # @param start The date of the first row of the usage matrix
+    # @param inventory A list of the Inventory item ids, one per column
+    # @param usage A Days x Inventory matrix of the grams used each day
+    # @param window The number of days in the rolling mean of the burn rate
+    def __init__(self, start, inventory, usage, window=28):
+        self.start = start
+        self.inventory = np.array(inventory, dtype=np.int64)
+        self.usage = np.asarray(usage, dtype=float).reshape(-1, len(inventory))
+        self.window = max(int(window), 1)
+
+    ##
+    # @brief Load the usage history of a range of days from the DB
+    #
+    # @param start The first day of the history
+    # @param end The last day of the history, inclusive
+    # @param window The number of days in the rolling mean of the burn rate
+    # @return A new StockForecast
+    @classmethod
+    def load(cls, start, end, window=28):
+        inventory = list(Inventory.objects.order_by('id').values_list('id', flat=True))
+        column = {inv: col for col, inv in enumerate(inventory)}
+        usage = np.zeros((max((end - start).days + 1, 0), len(inventory)))
+
+        rows = InventoryUsage.objects.filter(date__gte=start, date__lte=end) \
+                .values_list('date', 'item', 'amount_used')
+        for day, item, amount in rows.iterator(chunk_size=2000):
+            if item in column:
+                usage[(day - start).days, column[item]] += amount
+
+        return cls(start, inventory, usage, window)
+
+    ##
+    # @brief Get the rolling mean of the usage of each day
+    #
+    # The mean of the first days is over the days available so far.
+    #
+    # @return A Days x Inventory matrix of the mean usage of the `window` days ending on each day
+    def rollingMean(self):
+        sums = np.cumsum(self.usage, axis=0)
+        lagged = np.zeros_like(sums)
+        lagged[self.window:] = sums[:-self.window]
+        counts = np.minimum(np.arange(1, len(sums) + 1), self.window)[:, None]
+        return (sums - lagged) / counts
+
+    ##
+    # @brief Get the current burn rate of each item
+    #
+    # @return A vector of the grams of each item used per day
+    def burnRates(self):
+        if len(self.usage) == 0:
+            return np.zeros(len(self.inventory))
+        return self.rollingMean()[-1]
+
+    ##
+    # @brief Get the weekday factor of each item
+    #
+    # The factor is the mean usage on a day of the week divided by the mean usage
+    # on every day. It is 1 for items which were never used and for days of the
+    # week which are not in the history.
+    #
+    # @return A 7 x Inventory matrix, where row 0 is Monday
+    def seasonality(self):
+        weekdays = (np.arange(len(self.usage)) + self.start.weekday()) % 7
+        totals = np.zeros((7, len(self.inventory)))
+        np.add.at(totals, weekdays, self.usage)
+        counts = np.bincount(weekdays, minlength=7)[:, None]
+
+        overall = self.usage.mean(axis=0) if len(self.usage) > 0 else np.zeros(len(self.inventory))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factors = (totals / counts) / overall
+        return np.where((counts > 0) & (overall > 0), factors, 1.0)
+
+    ##
+    # @brief Project the usage of each future day
+    #
+    # @param start The first day to project
+    # @param days The number of days to project
+    # @return A Days x Inventory matrix of the projected grams used each day
+    def project(self, start, days):
+        weekdays = (np.arange(days) + start.weekday()) % 7
+        return self.burnRates()[None, :] * self.seasonality()[weekdays]
+
+    ##
+    # @brief Forecast when each item runs out and how much of it to reorder
+    #
+    # An item runs out on the first day that its projected usage since `start` is
+    # more than its stock. The reorder quantity covers the projected usage of
+    # `lead_days + cover_days` days, less the stock and the amount already on order,
+    # rounded up to whole units of restock.
+    #
+    # @param start The first day of the forecast, usually today
+    # @param lead_days The number of days for a restock to arrive
+    # @param cover_days The number of days the stock should last after it arrives
+    # @param horizon The number of days to look for a stock-out in
+    # @return A list of dictionaries, one per Inventory item, with 'id', 'name',
+    # 'stock', 'ordered', 'burn_rate', 'days_left' (None if the item does not run
+    # out within the horizon), 'reorder' (grams) and 'reorder_units', sorted by days_left
+    def report(self, start, lead_days=7, cover_days=14, horizon=365):
+        items = Inventory.objects.in_bulk(self.inventory.tolist())
+        stock = np.array([items[i].stock for i in self.inventory.tolist()], dtype=float)
+        ordered = np.array([items[i].ordered or 0.0 for i in self.inventory.tolist()], dtype=float)
+        per_unit = np.array([items[i].amount_per_unit for i in self.inventory.tolist()], dtype=float)
+
+        projected = np.cumsum(self.project(start, max(horizon, lead_days + cover_days)), axis=0)
+
+        runs_out = projected[:horizon] > stock
+        days_left = np.where(runs_out.any(axis=0), runs_out.argmax(axis=0), -1)
+
+        needed = projected[lead_days + cover_days - 1] if lead_days + cover_days > 0 else np.zeros(len(stock))
+        reorder = np.maximum(needed - stock - ordered, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            units = np.where(per_unit > 0, np.ceil(reorder / per_unit), 0)
+
+        burn = self.burnRates()
+        rows = [{
+            'id': inv,
+            'name': items[inv].name,
+            'stock': stock[col],
+            'ordered': ordered[col],
+            'burn_rate': burn[col],
+            'days_left': int(days_left[col]) if days_left[col] >= 0 else None,
+            'reorder': reorder[col],
+            'reorder_units': int(units[col]),
+        } for col, inv in enumerate(self.inventory.tolist())]
+
+        rows.sort(key=lambda row: (row['days_left'] is None, row['days_left'] or 0, row['name']))
+        return rows
@@ -2,8 +2,11 @@ from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import *
 from crispy_forms.bootstrap import *
-from .models import Customization
 from django.forms import MultipleChoiceField, ChoiceField
+import re
+import threading
+
+from .catalog import getCatalog
 
 class CustomizationForm(forms.Form):
     def __init__(self, *args, **kwargs):
@@ -32,13 +35,11 @@ class CustomizationForm(forms.Form):
     size = forms.ChoiceField(required=False, 
                              widget=forms.Select(attrs={
                                                     'value':'Grande',
-                                                    'onchange':'submit()',
                                                     'form':'customization_form'})
                              )
     amount = forms.IntegerField(min_value=1, required=False, 
                             widget=forms.NumberInput(attrs={
                                                     'value':1,
-                                                    'onchange':'submit()',
                                                     'form':'customization_form'})
                             )
 
@@ -48,76 +49,100 @@ class CustomizationForm(forms.Form):
         self.fields['size'].initial = 'Grande'
         self.fields['amount'].initial = 1
         
-class SplashForm(forms.Form):
-    SPLASH_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="splash"))
-    splahes = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=SPLASH_CHOICES, required=False)
-    
-class MilkForm(forms.Form):
-    MILK_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="milk"))
-    milk = ChoiceField(label="Milk:", choices=MILK_CHOICES, required=False)
-    
-class ExtraShotForm(forms.Form):
-    Extra_shot = forms.IntegerField(initial=0, min_value=0, max_value=3, required=False)
-
-class SyrupForm(forms.Form):
-    Apple_Brown_Sugar = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Apple Brown Sugar:")
-    Brown_Sugar = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Brown Sugar:")
-    Caramel = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Caramel:")
-    Cinnamon_Dolce = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Cinnamon Dolce:")
-    Hazelnut = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Hazelnut:")
-    Peppermint = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Peppermint:")
-    Raspberry = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Raspberry:")
-    Toasted_Vanilla = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Toasted Vanilla:")
-    Toffee_Nut = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Toffee Nut:")
-    Vanilla = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Vanilla:")
-    Sugar_Free_Vanilla = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Sugar free Vanilla:")
-
-class SauceForm(forms.Form):
-    Mocha = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Mocha:")
-    New_Dark_Caramel = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Dark Caramel")
-    Pumpkin = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Pumpkin:")
-    White_Chocolate_Mocha_Sauce = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="White Chocolate Mocha:")
-    
-class DrizzleForm(forms.Form):
-    DRIZZLE_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="drizzle"))
-    drizzles = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=DRIZZLE_CHOICES, required=False)
+##
+# @brief Base class of the forms of each Customization type
+#
+# The forms are generated from the catalog by customizationForm(). A form has a
+# single choice field (e.g. milk), a checkbox for each Customization (e.g.
+# toppings), or a number field for the amount of each Customization (e.g. syrup
+# pumps), depending on its type.
+class CustomizationTypeForm(forms.Form):
 
-class LiningForm(forms.Form):
-    LINING_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="lining"))
-    linings = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=LINING_CHOICES, required=False)
+    ## The Customization type of the form
+    customization_type = None
 
-class ToppingForm(forms.Form):
-    TOPPING_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="topping"))
-    toppings = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=TOPPING_CHOICES, required=False)
+    ## The Customization id of each amount field, by field name
+    customization_ids = dict()
 
-class MixForm(forms.Form):
-    Vanilla_bean_powder = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Vanilla Bean Powder:")
-    Chocolate_malt_powder = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Chocolate Malt Powder:")
+    ##
+    # @brief Get the Customizations chosen in the form
+    #
+    # The form must be valid.
+    #
+    # @return A list of (Customization id, amount) tuples
+    def selected(self):
+        result = list()
+        for field, value in self.cleaned_data.items():
+            if not value:
+                continue
+            if field in self.customization_ids:
+                result.append((self.customization_ids[field], int(value)))
+            elif isinstance(value, list):
+                result.extend((int(v), 1) for v in value)
+            else:
+                result.append((int(value), 1))
+        return result
 
-class FoamForm(forms.Form):
-    FOAM_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="foam"))
-    foams = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=FOAM_CHOICES, required=False)
+## Customization types where only one of the type can be chosen
+CHOICE_TYPES = ('milk',)
 
-class SweetenerForm(forms.Form):
-    Classic_syrup = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Classic Syrup:")
-    Liquid_cane_sugar = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Liquid Cane Suagr")
-    Honey_blend = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Honey Blend:")
+## Customization types where each of the type can be added once
+MULTIPLE_TYPES = ('splash', 'drizzle', 'lining', 'topping', 'foam', 'inclusion')
 
+## The most of one Customization that can be added, by type
+MAX_AMOUNTS = {'coffee': 3}
+DEFAULT_MAX_AMOUNT = 12
 
-class SweetenerPacketForm(forms.Form):
-    Sweet_n_low = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Sweet n Low:")
-    Equal = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Equal:")
-    Splenda = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Splenda:")
-    Stevia_blend = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Stevia Blend:")
+##
+# @brief Build the form class of a Customization type
+#
+# @param cust_type The Customization type, lowercase
+# @param customizations A list of the Customizations of the type
+# @return A subclass of CustomizationTypeForm
+def buildCustomizationForm(cust_type, customizations):
+    label = cust_type.replace('-', ' ').capitalize() + ':'
+    choices = [(cust.pk, cust.name) for cust in customizations]
+    attrs = {'customization_type': cust_type, 'customization_ids': dict()}
 
-class InclusionForm(forms.Form):
-    INCLUSION_CHOICES = ((item.id, item.name) for item in Customization.objects.filter(type__iexact="inclusion"))
-    inclusions = MultipleChoiceField(widget=forms.CheckboxSelectMultiple, choices=INCLUSION_CHOICES, required=False)
+    if cust_type in CHOICE_TYPES:
+        attrs[cust_type] = ChoiceField(label=label, choices=choices, required=False)
+    elif cust_type in MULTIPLE_TYPES:
+        attrs[cust_type] = MultipleChoiceField(label=label, widget=forms.CheckboxSelectMultiple,
+                                               choices=choices, required=False)
+    else:
+        for cust in customizations:
+            field = re.sub(r'\W+', '_', cust.name).strip('_') or 'customization'
+            if field in attrs or hasattr(CustomizationTypeForm, field):
+                field = f"{field}_{cust.pk}"
+            attrs[field] = forms.IntegerField(initial=0, min_value=0, required=False, label=f"{cust.name}:",
+                                              max_value=MAX_AMOUNTS.get(cust_type, DEFAULT_MAX_AMOUNT))
+            attrs['customization_ids'][field] = cust.pk
 
-    
-class ChaiForm(forms.Form):
-    Chai_pump = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Chai Pump:")
+    name = ''.join(part.capitalize() for part in re.split(r'\W+', cust_type)) + 'Form'
+    return type(name, (CustomizationTypeForm,), attrs)
+
+form_classes = dict()
+form_classes_lock = threading.Lock()
+
+##
+# @brief Get the form class of a Customization type
+#
+# The classes are built the first time each type is used, from the catalog, and
+# are rebuilt when the catalog is reloaded. Importing this module and rendering
+# a form therefore issue no queries.
+#
+# @param cust_type The Customization type, case insensitive
+# @return A subclass of CustomizationTypeForm, or None if there are no
+# Customizations of the type
+def customizationForm(cust_type):
+    catalog = getCatalog()
+    cust_type = cust_type.lower()
+
+    with form_classes_lock:
+        cached = form_classes.get(cust_type)
+        if cached is None or cached[0] is not catalog:
+            customizations = catalog.customizationsOfType(cust_type)
+            form = buildCustomizationForm(cust_type, customizations) if len(customizations) > 0 else None
+            cached = form_classes[cust_type] = (catalog, form)
 
-class JuiceForm(forms.Form):
-    Apple_juice = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Apple Juice:")
-    Peach_juice_blend = forms.IntegerField(initial=0, min_value=0, max_value=12, required=False, label="Peach Juice Blend:")
+    return cached[1]
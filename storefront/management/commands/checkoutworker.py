@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from storefront.models import CheckoutTask
+
+##
+# @brief Management command which drains the CheckoutTask queue
+#
+# Run with `python manage.py checkoutworker`. The worker checks out queued
+# orders in batches until it is stopped, sleeping whenever the queue is empty.
+class Command(BaseCommand):
+    help = "Check out the orders waiting in the CheckoutTask queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Maximum number of orders to check out at once")
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help="Number of failed attempts before an order is given up on")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of waiting for more orders")
+
+    def handle(self, *args, **options):
+        while True:
+            count = CheckoutTask.process(options['batch_size'], options['max_attempts'])
+            if count > 0:
+                self.stdout.write(f"Processed {count} orders")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from storefront.models import Finance, Order
+
+##
+# @brief Management command which recalculates the Finance table
+#
+# Run with `python manage.py rebuildfinances [--start YYYY-MM-DD] [--end YYYY-MM-DD]`.
+# Checkout keeps the Finance rows current, so this is only needed after 
+# editing orders or recipes by hand. Without dates, every day with an order
+# is recalculated.
+class Command(BaseCommand):
+    help = "Recalculate the daily Finance rows for a range of dates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help="First day to recalculate (default: the first order)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat,
+                            help="Last day to recalculate (default: the last order)")
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help="Number of days recalculated by each statement")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Number of chunks recalculated in parallel")
+
+    def handle(self, *args, **options):
+        dates = Order.objects.aggregate(start=Min('date'), end=Max('date'))
+        start = options['start'] or dates['start']
+        end = options['end'] or dates['end']
+
+        if start is None or end is None:
+            self.stdout.write("There are no orders to recalculate")
+            return
+        if start > end or options['chunk_days'] < 1:
+            raise CommandError("The start date must be before the end date and chunks must be at least one day")
+
+        Finance.rebuild(start, end, options['chunk_days'], options['workers'])
+        self.stdout.write(f"Recalculated finances from {start} to {end}")
@@ -0,0 +1,26 @@
+from django.conf import settings
+
+from .cart import Cart
+
+##
+# @brief Keep the cart-count cookie equal to the number of items in the cart
+#
+# The header shows the cart badge from this cookie, so that the HTML of the menu
+# pages is the same for every visitor and can be cached (see PageCache). The
+# cookie is only checked when the request used the session, and only set when
+# the count changed.
+class CartCountMiddleware():
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        if session is not None and session.accessed:
+            count = str(len(Cart(session)))
+            if request.COOKIES.get(Cart.COUNT_COOKIE) != count:
+                response.set_cookie(Cart.COUNT_COOKIE, count, max_age=settings.SESSION_COOKIE_AGE, samesite='Lax')
+
+        return response
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storefront', '0030_remove_salespair_a_b_unique_salespair_item_a_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutTask',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='storefront.order')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('available', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.IntegerField(default=0)),
+                ('done', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storefront', '0032_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulativeUsage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('total', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='storefront.inventory')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cumulativeusage',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='cumulative_usage_unique'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO storefront_cumulativeusage (date, item_id, total)
+            SELECT date, item_id, SUM(amount_used) OVER (PARTITION BY item_id ORDER BY date)
+            FROM storefront_inventoryusage
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storefront', '0033_cumulativeusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='finance',
+            name='revision',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.3 on 2026-10-18 08:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storefront', '0034_finance_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='placed',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        # Orders placed before this field existed only have a date, so they are
+        # placed at the start of that day instead of at the time of the migration
+        migrations.RunSQL(
+            "UPDATE orders SET placed = date::timestamptz WHERE date IS NOT NULL",
+            migrations.RunSQL.noop,
+        ),
+    ]
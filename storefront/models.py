@@ -1,5 +1,9 @@
 from django.db.models import *
-from django.db import connection
+from django.db import connection, transaction
+from django.db.models.functions import Coalesce, TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import itertools
 import datetime
 
@@ -64,16 +68,117 @@ class Finance(Model):
     ## Profit in dollars for that day
     profit = DecimalField(blank=True, max_digits=11, decimal_places=2)
 
+    ## Number of times the row has changed. Reports cached for a range of days
+    # are still valid as long as the revisions of those days have not changed.
+    revision = BigIntegerField(default=0)
+
     ##
     # @brief Create Finance instances for each day where there 
     # was an order
     #
-    # Note that this method calculates the profit for all the days requested.
+    # Note that this method recalculates every day from scratch. Checkout keeps
+    # the rows current on its own, so this is only needed to repair the table.
     @classmethod
     def createAll(cls):
-        for date in Order.objects.distinct('date').values('date'):
-            fin = cls.create(date['date'])
-            fin.getProfit()
+        dates = Order.objects.aggregate(start=Min('date'), end=Max('date'))
+        if dates['start'] is not None:
+            cls.rebuild(dates['start'], dates['end'])
+
+    ##
+    # @brief Get the SQL which calculates the revenue and expenses of a set of orders
+    #
+    # The revenue is the cost of every OrderItem and the expenses are the price
+    # of the Inventory used, which is read from a CTE named 'usage' holding the
+    # rows of Order.usageSQL(). Checkout and rebuild both use this, so that the 
+    # rows they write always agree.
+    #
+    # @param orders SQL for the array of Order primary keys to include
+    # @return The SQL string, returning rows of (date, revenue, expenses)
+    @classmethod
+    def totalsSQL(cls, orders="%(orders)s"):
+        return f"""
+            SELECT date, COALESCE(r.revenue, 0) AS revenue, COALESCE(e.expenses, 0) AS expenses
+            FROM (
+                SELECT o.date, SUM(oi.cost) AS revenue
+                FROM {OrderItem._meta.db_table} oi
+                JOIN {Order._meta.db_table} o ON o.id = oi.order_id
+                WHERE oi.order_id = ANY({orders})
+                GROUP BY o.date
+            ) r
+            FULL JOIN (
+                SELECT u.date, ROUND(SUM(u.stock_used * i.price / i.amount_per_unit)::numeric, 2) AS expenses
+                FROM usage u JOIN {Inventory._meta.db_table} i ON i.id = u.item_id
+                GROUP BY u.date
+            ) e USING (date)
+        """
+
+    ##
+    # @brief Recalculate the Finance rows of a range of days
+    #
+    # The range is split into chunks of days which are recalculated in parallel,
+    # each with a single statement on its own connection. Orders still waiting
+    # in the CheckoutTask queue are left out, since checkout adds them when it 
+    # processes them. Days which have a row but no orders are set to zero.
+    #
+    # @param start The first day to recalculate
+    # @param end The last day to recalculate, inclusive
+    # @param chunk_days The number of days recalculated by each statement
+    # @param workers The number of chunks recalculated at the same time
+    @classmethod
+    def rebuild(cls, start, end, chunk_days=31, workers=4):
+        chunks = list()
+        while start <= end:
+            chunks.append((start, min(end, deltaDate(start, chunk_days - 1))))
+            start = deltaDate(start, chunk_days)
+
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                cls.rebuildChunk(*chunk)
+            return
+
+        def run(chunk):
+            # Each thread gets its own connection, which must be closed when done
+            try:
+                cls.rebuildChunk(*chunk)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, chunks))
+
+    ##
+    # @brief Recalculate the Finance rows of a range of days in one statement
+    #
+    # @param start The first day to recalculate
+    # @param end The last day to recalculate, inclusive
+    @classmethod
+    def rebuildChunk(cls, start, end):
+        orders = f"""ARRAY(
+            SELECT o.id FROM {Order._meta.db_table} o
+            WHERE o.date BETWEEN %(start)s AND %(end)s AND NOT EXISTS (
+                SELECT 1 FROM {CheckoutTask._meta.db_table} t
+                WHERE t.order_id = o.id AND t.done IS NULL
+            )
+        )"""
+        fin_table = cls._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                WITH usage AS ({Order.usageSQL(orders)}),
+                totals AS ({cls.totalsSQL(orders)})
+                INSERT INTO {fin_table} (date, revenue, expenses, profit, revision)
+                SELECT date, COALESCE(t.revenue, 0), COALESCE(t.expenses, 0),
+                       COALESCE(t.revenue, 0) - COALESCE(t.expenses, 0), 1
+                FROM totals t
+                FULL JOIN (
+                    SELECT date FROM {fin_table} WHERE date BETWEEN %(start)s AND %(end)s
+                ) f USING (date)
+                ON CONFLICT (date) DO UPDATE
+                SET revenue = EXCLUDED.revenue,
+                    expenses = EXCLUDED.expenses,
+                    profit = EXCLUDED.profit,
+                    revision = {fin_table}.revision + 1
+            """, {'start': start, 'end': end})
 
     ##
     # @brief Create or fetch a Finance instance for the given day
@@ -97,19 +202,14 @@ class Finance(Model):
     ##
     # @brief Calculate the expenses for the day
     #
-    # Calculates the expenses and saves them to the database
+    # Calculates the expenses and saves them to the database. The expenses are
+    # the price of the Inventory used by the day's recipes and customizations, 
+    # the same as what checkout adds to the row.
     # @return The expenses for the day
     def getExpenses(self):
-        invPrice = Sum(ExpressionWrapper(
-            F('orderitem__menu_item__ingredients__price'),
-            output_field=FloatField()) * 
-                              (F('orderitem__menu_item__ingredient__amount') /
-                              F('orderitem__menu_item__ingredients__amount_per_unit'))
-            )
-        
-        self.expenses = self.getOrders().aggregate(price=invPrice)['price']
-        if self.expenses == None:
-            self.expenses = 0.00
+        usage = self.getInventoryUsage()
+        prices = Inventory.objects.filter(id__in=usage).values_list('id', 'price', 'amount_per_unit')
+        self.expenses = round(sum(usage[i] * float(price) / per_unit for i, price, per_unit in prices), 2)
 
         return self.expenses
 
@@ -140,21 +240,19 @@ class Finance(Model):
         self.getRevenue()
         
         self.profit = self.revenue - self.expenses
+        self.revision += 1
 
         self.save()
 
         return self.profit
 
     ##
-    # @brief Return a dictionary of Inventory instances and amount of each used in the day
+    # @brief Return a dictionary of Inventory ids and amount of each used in the day
     #
-    # @returns A dictionary relating Inventory items to the amount used that day
+    # @returns A dictionary relating Inventory item ids to the amount used that day
     def getInventoryUsage(self):
-        inv = dict()
-        for order in self.getOrders():
-            invSum(inv, order.getInventoryUsage())
-
-        return inv
+        from .recipes import getRecipes
+        return getRecipes().itemUsage(OrderItem.objects.filter(order__date=self.pk))
 
     class Meta:
         db_table = 'finances'
@@ -168,6 +266,9 @@ class Finance(Model):
 def deltaDate(day, delta):
     return datetime.date.fromordinal(day.toordinal() + int(delta))
 
+## A row of FinanceView.sellsTogetherTopK, with the same fields as the rows of sellsTogetherReport
+PairRow = namedtuple('PairRow', ['item_a_name', 'item_b_name', 'total', 'item_a_image', 'item_b_image'])
+
 ##
 # @brief A class to provide analytical functions over multiple
 # financial days
@@ -227,29 +328,113 @@ class FinanceView():
     ##
     # @brief Get a QuerySet representing the inventory usage for these days
     # 
+    # The usage is the difference between the CumulativeUsage totals at the end
+    # date and the day before the start date, which takes two index lookups per
+    # Inventory item no matter how many days are in the view.
+    #
     # @return A QuerySet of Inventory items used, with a 'stock_used' column appended to it
     def getInventoryUsage(self):
-        usage = InventoryUsage.objects.filter(date__gte=self.start_date, date__lte=self.end_date)
+        before = deltaDate(datetime.date.fromisoformat(str(self.start_date)), -1)
 
-        # Get the sum total of each item used
-        # Basically equivalent to usage.aggregate(amount=Sum('amount_used'))
-        amount_query = usage.filter(item=OuterRef('id')).values('item').annotate(amount=Sum('amount_used')).values('amount')
-
-        return Inventory.objects.filter(id__in=usage.values('item')).annotate(
-                stock_used=Subquery(amount_query))
+        return Inventory.objects.annotate(
+                stock_used=Coalesce(CumulativeUsage.totalAt(self.end_date), 0.0) -
+                           Coalesce(CumulativeUsage.totalAt(before), 0.0)
+                ).filter(stock_used__gt=0)
     
+    ## The columns which each level of the sales report is grouped by
+    SALES_GROUPS = {
+        'item': {'menu_id': F('menu_item'), 'name': F('menu_item__name'), 'size': F('menu_item__size'),
+                 'type': F('menu_item__type'), 'image': F('menu_item__image')},
+        'name': {'name': F('menu_item__name')},
+        'type': {'type': F('menu_item__type')},
+    }
+
+    ##
+    # @brief Return the units, revenue and number of orders of each Menu item sold
+    #
+    # The report is one grouped query over the OrderItems of the date range. It can
+    # be grouped by Menu item ('item'), by drink name with the sizes collapsed 
+    # ('name') or by Menu type ('type'). Each row is a dictionary with the grouped
+    # columns (see SALES_GROUPS) and 'units', 'revenue' and 'orders'. Items which 
+    # sold nothing are not in the report.
+    #
+    # The QuerySet is not evaluated, so it can be paginated with Django's Paginator.
+    #
+    # @param group The level to group the report by, one of SALES_GROUPS
+    # @return A QuerySet of dictionaries, sorted by the units sold
+    def salesReport(self, group='item'):
+        if group not in self.SALES_GROUPS:
+            raise ValueError(f"Cannot group the sales report by '{group}'")
+
+        keys = self.SALES_GROUPS[group]
+        qset = OrderItem.objects.filter(order__date__gte=self.start_date, order__date__lte=self.end_date) \
+                .values(**keys).annotate(
+                    units=Sum('amount'),
+                    revenue=Sum('cost'),
+                    orders=Count('order', distinct=True))
+
+        if group == 'name':
+            qset = qset.annotate(image=Min('menu_item__image'))
+
+        return qset.order_by('-units', *keys)
+
     ##
-    # @brief Return a QuerySet of the Menu items sold, with a 'sales' column annotated
+    # @brief Return the units, revenue and number of orders of each Menu item sold
     # 
-    # Items which sold nothing have 'sales' set to 0.
+    # Same as salesReport('item').
     #
-    # @return A QuerySet of Menu items with a new column describing how many were sold
+    # @return A QuerySet of dictionaries, one per Menu item sold
     def salesByItem(self):
-        items = OrderItem.objects.filter(order__in=self.orders_set.values('id'))
+        return self.salesReport('item')
 
-        sum_query = items.filter(menu_item=OuterRef('id')).order_by().annotate(num=Value(1)).values('num').annotate(total=Sum('num', default=0)).values('total')
+    ## Functions which truncate a time to the start of its bucket, for the time series
+    BUCKETS = {'hour': TruncHour, 'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
 
-        return Menu.objects.annotate(sales=Subquery(sum_query)).order_by('-sales')
+    def _bucket(self, bucket, field):
+        if bucket not in self.BUCKETS:
+            raise ValueError(f"Cannot group the time series by '{bucket}'")
+        return self.BUCKETS[bucket](field)
+
+    ##
+    # @brief Return the orders, units and revenue of each hour, day, week or month
+    #
+    # Orders are put into buckets by the time they were placed, truncated in the
+    # current time zone. Buckets without any orders are left out.
+    #
+    # @param bucket The size of the buckets, one of BUCKETS
+    # @return A list of dictionaries with 'bucket' (the start of the bucket),
+    # 'orders', 'units' and 'revenue', sorted by time
+    def salesSeries(self, bucket='day'):
+        return list(OrderItem.objects.filter(order__date__gte=self.start_date, order__date__lte=self.end_date)
+                    .annotate(bucket=self._bucket(bucket, 'order__placed')).values('bucket').annotate(
+                        orders=Count('order', distinct=True),
+                        units=Sum('amount'),
+                        revenue=Sum('cost')).order_by('bucket'))
+
+    ##
+    # @brief Return the Inventory used in each hour, day, week or month
+    #
+    # The Menu items and Customizations sold in each bucket are counted with two
+    # grouped queries, and the usage of every bucket is calculated at once with
+    # the recipe matrices.
+    #
+    # @param bucket The size of the buckets, one of BUCKETS
+    # @return A tuple of the list of bucket starts, the array of Inventory ids of
+    # each column, and a Buckets x Inventory matrix of the grams used
+    def usageSeries(self, bucket='day'):
+        from .recipes import getRecipes
+        recipes = getRecipes()
+
+        menu_rows = OrderItem.objects.filter(order__date__gte=self.start_date, order__date__lte=self.end_date) \
+                .annotate(bucket=self._bucket(bucket, 'order__placed')) \
+                .values_list('bucket', 'menu_item').annotate(n=Sum('amount')).order_by()
+        cust_rows = ItemCustomization.objects.filter(order_item__order__date__gte=self.start_date,
+                                                     order_item__order__date__lte=self.end_date) \
+                .annotate(bucket=self._bucket(bucket, 'order_item__order__placed')) \
+                .values_list('bucket', 'customization').annotate(n=Sum(F('amount') * F('order_item__amount'))).order_by()
+
+        buckets, usage = recipes.groupUsage(menu_rows, cust_rows)
+        return buckets, recipes.inventory, usage
 
     ##
     # @brief Return the Inventory items which sold less than the given percent of their stock
@@ -272,48 +457,132 @@ class FinanceView():
 
 
     ##
-    # @brief Return a QuerySet of SalesPair rows, each of which describes a pair of items 
-    # that sell together and how many times they sold together. 
-    # 
-    # The date in these objects is meaningless. The user should interpret the report as
-    # being the sum of all of the sold object pairs in the date interval given.
+    # @brief Forecast when each Inventory item runs out, from the usage in the date range
+    #
+    # The usage of the days in this view is the history that the burn rates and the
+    # weekday factors are computed from. The forecast starts the day after the end
+    # of the view (see StockForecast.report).
     #
-    # Note that the queryset returned by this has some restrictions, such as being unable
-    # to be ordered using `.order_by()`.
+    # @param window The number of days in the rolling mean of the burn rate
+    # @param lead_days The number of days for a restock to arrive
+    # @param cover_days The number of days the stock should last after it arrives
+    # @return A list of dictionaries, one per Inventory item, sorted by the days until it runs out
+    def forecastReport(self, window=28, lead_days=7, cover_days=14):
+        from .forecast import StockForecast
+
+        start = datetime.date.fromisoformat(str(self.start_date))
+        end = datetime.date.fromisoformat(str(self.end_date))
+        return StockForecast.load(start, end, window).report(deltaDate(end, 1), lead_days, cover_days)
+
+    ##
+    # @brief Return the sets of items, of any size, which are in many orders in the date range
+    #
+    # The itemsets are mined with FP-growth (see baskets.BasketMiner), which is
+    # cached per date range and updated with new orders as they are placed. Pairs
+    # are the itemsets with min_size=2 and max_size=2.
     #
-    # @returns A QuerySet describing how frequently pairs of items sold together
-    def sellsTogetherReport(self):
+    # @param min_support The minimum fraction of orders (0 < min_support <= 1) an itemset must be in
+    # @param min_size The smallest itemsets to return
+    # @param max_size The largest itemsets to return, or None for any size
+    # @param limit The maximum number of itemsets to return, or None for every itemset
+    # @return A list of (tuple of Menu item names, number of orders, fraction of orders)
+    # tuples, sorted by the number of orders
+    def frequentItemsets(self, min_support=0.01, min_size=1, max_size=None, limit=None):
+        from .baskets import getMiner
+
+        start = datetime.date.fromisoformat(str(self.start_date))
+        end = datetime.date.fromisoformat(str(self.end_date))
+        itemsets = getMiner(start, end).itemsets(min_support, min_size, max_size)
+        return itemsets if limit is None else itemsets[:limit]
 
+    ##
+    # @brief Return the pairs of items that sold together the most in the date range
+    # 
+    # The report is a single grouped query over SalesPair, sorted and limited by the 
+    # DB. Each row is a named tuple with the fields item_a_name, item_b_name, total,
+    # item_a_image and item_b_image. The images are joined in the same query, so
+    # displaying the report does not run any more queries.
+    #
+    # @param limit The maximum number of pairs to return, or None for every pair
+    # @returns A QuerySet of named tuples, sorted by the total times sold together
+    def sellsTogetherReport(self, limit=None):
         qset = SalesPair.objects.filter(
             date__gte=self.start_date, 
-            date__lte=self.end_date).distinct('item_a', 'item_b').annotate(
-            total=Subquery(
-                SalesPair.objects.filter(
-                    item_a=OuterRef('item_a'), 
-                    item_b=OuterRef('item_b'),
-                    date__gte=self.start_date,
-                    date__lte=self.end_date,
-                    ).values('item_a','item_b').annotate(total=Sum('amount')).values('total')
-                )
-            )
+            date__lte=self.end_date).values('item_a_name', 'item_b_name').annotate(
+            total=Sum('amount'),
+            item_a_image=Min('item_a__image'),
+            item_b_image=Min('item_b__image'),
+            ).values_list('item_a_name', 'item_b_name', 'total', 'item_a_image', 'item_b_image',
+                          named=True).order_by('-total', 'item_a_name', 'item_b_name')
+
+        return qset if limit is None else qset[:limit]
 
-        return qset
+    ## The columns of the sellsTogetherReport that it can be sorted on
+    PAIR_COLUMNS = ('total', 'item_a_name', 'item_b_name')
 
     ##
-    # @brief Returns the sellsTogetherReport, but as a Python list sorted by the total 
-    # amount of each pair sold. 
+    # @brief Returns the sellsTogetherReport as a Python list sorted by the given column.
     #
     # By default the list is sorted in descending order on the column total.
+    # The sorting and the limit are both done by the DB.
     #
     # @param descending Whether to sort in descending (True) or ascending (False) order
-    # @param col The name of table column to sort on
-    # @param disp A python function taking a single SalesPair and returning the value
-    # @param limit The maximum number of objects to get
+    # @param col The name of the column to sort on, one of PAIR_COLUMNS
+    # @param disp A python function taking a single row of the report and returning the value
     # to return in the sorted list. Basically your __repr__ function
+    # @param limit The maximum number of rows to get
     def sellsTogetherReportSorted(self, descending=True, col='total', disp=lambda x: x, limit=100):
-        totals = list(self.sellsTogetherReport().all())
-        totals.sort(key=lambda x: eval(f"{-1.0 if descending else 1.0}*x.{col}"))
-        return [disp(x) for x in totals[:limit]]
+        if col not in self.PAIR_COLUMNS:
+            raise ValueError(f"Cannot sort the report on '{col}'")
+
+        order = [f"{'-' if descending else ''}{col}"] + [c for c in self.PAIR_COLUMNS if c != col]
+        return [disp(x) for x in self.sellsTogetherReport().order_by(*order)[:limit]]
+
+    ##
+    # @brief Return the pairs of items that sold together the most, without holding
+    # every pair of the date range in memory
+    #
+    # The SalesPair rows are read with a server-side cursor, one chunk of days at a
+    # time, and folded into a SpaceSaving counter. The memory used depends on the
+    # capacity of the counter, not on the length of the date range. The totals are
+    # exact as long as there are at most `capacity` distinct pairs in the range,
+    # and can only be overestimated otherwise.
+    #
+    # @param k The number of pairs to return
+    # @param chunk_days The number of days read by each query
+    # @param capacity The number of pairs counted, at least k
+    # @param progress A function taking (days done, total days), called after each chunk
+    # @returns A list of PairRow, sorted by the total times sold together
+    def sellsTogetherTopK(self, k=100, chunk_days=31, capacity=10000, progress=None):
+        from .topk import SpaceSaving
+
+        start = datetime.date.fromisoformat(str(self.start_date))
+        end = datetime.date.fromisoformat(str(self.end_date))
+        total_days = max((end - start).days + 1, 0)
+        counter = SpaceSaving(max(capacity, k))
+
+        if progress is not None:
+            progress(0, total_days)
+
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, deltaDate(chunk_start, chunk_days - 1))
+            pairs = SalesPair.objects.filter(date__gte=chunk_start, date__lte=chunk_end).values_list(
+                'item_a_name', 'item_b_name').annotate(total=Sum('amount')).order_by()
+
+            for item_a, item_b, total in pairs.iterator(chunk_size=2000):
+                counter.add((item_a, item_b), total)
+
+            chunk_start = deltaDate(chunk_end, 1)
+            if progress is not None:
+                progress((chunk_end - start).days + 1, total_days)
+
+        top = counter.top(k)
+        images = dict(Menu.objects.filter(name__in={name for pair, _ in top for name in pair})
+                      .values_list('name').annotate(image=Min('image')).order_by())
+
+        return [PairRow(a, b, total, images.get(a), images.get(b)) for (a, b), total in top]
+
 ##
 # @brief Model to track the usage of Inventory items per day
 #
@@ -360,6 +629,106 @@ class InventoryUsage(Model):
             UniqueConstraint(fields=['date','item'], name='usage_unique')
         ]
 
+##
+# @brief Model holding the running total of each Inventory item used, by date
+#
+# Each row holds the total amount of an item used on every day up to and including
+# its date. Rows only exist for the days that the item was used. The usage between
+# any two dates is then the difference of two rows, found with two index lookups
+# per Inventory item, no matter how long the date range is. Checkout keeps the 
+# rows current (see Order.checkout_many).
+class CumulativeUsage(Model):
+
+    id = BigAutoField(primary_key=True)
+
+    ## Date of the last usage included in the total
+    date = DateField()
+
+    ## Inventory item that the total is for
+    item = ForeignKey('Inventory', on_delete=DO_NOTHING)
+
+    ## Amount of the item used up to and including the date
+    total = FloatField()
+
+    ##
+    # @brief Get a subquery of the running total of an item at a date
+    #
+    # @param date The date to get the total at, inclusive
+    # @param item The name of the outer column holding the Inventory item id
+    # @return A Subquery of the total, which is NULL if the item was never used before the date
+    @classmethod
+    def totalAt(cls, date, item='id'):
+        return Subquery(cls.objects.filter(item=OuterRef(item), date__lte=date)
+                        .order_by('-date').values('total')[:1])
+
+    ##
+    # @brief Get the SQL which adds a batch of usage to the running totals
+    #
+    # Reads the (date, item_id, stock_used) rows of a CTE named 'usage'. Rows
+    # on or after a date with new usage are increased by the usage of the batch
+    # up to their date, and rows are created for the days which had none.
+    # The table must be locked (see lockSQL) so that two batches do not compute
+    # their new totals from the same old rows.
+    #
+    # @return The SQL of two data-modifying CTEs, to be placed in a WITH clause
+    @classmethod
+    def addSQL(cls):
+        table = cls._meta.db_table
+        return f"""
+            cumulative_updated AS (
+                UPDATE {table} c SET total = c.total + (
+                    SELECT SUM(u.stock_used) FROM usage u
+                    WHERE u.item_id = c.item_id AND u.date <= c.date
+                )
+                FROM (SELECT item_id, MIN(date) AS date FROM usage GROUP BY item_id) first
+                WHERE c.item_id = first.item_id AND c.date >= first.date
+            ),
+            cumulative_inserted AS (
+                INSERT INTO {table} (date, item_id, total)
+                SELECT u.date, u.item_id, u.running + COALESCE((
+                           SELECT c.total FROM {table} c
+                           WHERE c.item_id = u.item_id AND c.date < u.date
+                           ORDER BY c.date DESC LIMIT 1
+                       ), 0)
+                FROM (
+                    SELECT date, item_id, SUM(stock_used) OVER (PARTITION BY item_id ORDER BY date) AS running
+                    FROM usage
+                ) u
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} c WHERE c.item_id = u.item_id AND c.date = u.date
+                )
+            )
+        """
+
+    ##
+    # @brief Get the SQL which locks the table against other batches, but not against reads
+    @classmethod
+    def lockSQL(cls):
+        return f"LOCK TABLE {cls._meta.db_table} IN EXCLUSIVE MODE"
+
+    ##
+    # @brief Recalculate every running total from the InventoryUsage table
+    @classmethod
+    def rebuild(cls):
+        table = cls._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(cls.lockSQL())
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"""
+                INSERT INTO {table} (date, item_id, total)
+                SELECT date, item_id, SUM(amount_used) OVER (PARTITION BY item_id ORDER BY date)
+                FROM {InventoryUsage._meta.db_table}
+            """)
+
+    def __str__(self):
+        return f"Usage of {self.item_id} up to {self.date} : {self.total}"
+
+    class Meta:
+        ## Constraint that dates and items must be unique, which also indexes lookups by item and date
+        constraints = [
+            UniqueConstraint(fields=['item', 'date'], name='cumulative_usage_unique')
+        ]
+
 ##
 # @brief This Model facilitates the creation of the SellsTogetherReport.
 #
@@ -374,14 +743,15 @@ class SalesPair(Model):
     ## The date that this instance is describing
     date = DateField()
 
-    # The two items (item_a and item_b) are "sorted" by the item they contain's 
-    # primary keys. This allows easy fetching of objects using min and max
+    # The two items (item_a and item_b) are sorted by name, since the pairs are
+    # unique by name. Sizes of the same drink therefore count as the same item, and
+    # the Menu item stored is the one with the smallest primary key for that name.
 
-    ## The item with the smaller primary key
+    ## The item with the smaller name
     item_a = ForeignKey('Menu', on_delete=CASCADE, related_name='item_a')
     item_a_name = TextField()
 
-    ## The item with the larger primary key
+    ## The item with the larger name
     item_b = ForeignKey('Menu', on_delete=CASCADE, related_name='item_b')
     item_b_name = TextField()
 
@@ -392,28 +762,128 @@ class SalesPair(Model):
     # @brief Fetch the corresponding SalesPair object, or create it if it doesn't exist.
     #
     # @param date The date to search for
-    # @param i1 One of the item pair. Doesn't have to be largest or smallest pk
-    # @param i2 The other item in the pair. Also doesn't have to be largest or smallest
+    # @param i1 One of the item pair. Doesn't have to be the smallest or largest name
+    # @param i2 The other item in the pair. Also doesn't have to be smallest or largest
     # @return A SalesPair object. Either a new one if the pair doesn't exist, or the 
     # corresponding one, if it exists.
     @classmethod 
     def getOrCreate(cls, date, i1, i2):
-        min_obj = min(i1, i2, key=lambda x: x.pk)
-        max_obj = max(i1, i2, key=lambda x: x.pk)
+        min_obj = min(i1, i2, key=lambda x: x.name)
+        max_obj = max(i1, i2, key=lambda x: x.name)
         objs = cls.objects.filter(date=date, item_a_name=min_obj.name, item_b_name=max_obj.name)
 
         if objs.exists():
             return objs.first()
         else:
             obj = cls(date=date, 
-                      item_a=min_obj.pk,
+                      item_a=min_obj,
                       item_a_name=min_obj.name,
-                      item_b=max_obj.pk,
+                      item_b=max_obj,
                       item_b_name=max_obj.name,
                       amount=0)
             obj.save()
             return obj
 
+    ##
+    # @brief Count every pair of items sold together in a basket of items
+    #
+    # Each item is counted as many times as it was ordered, so two items ordered
+    # n and m times make n*m pairs, and an item ordered n times is paired with
+    # itself n*(n-1)/2 times. Items with the same name are counted as one item.
+    #
+    # @param basket An iterable of (Menu item, amount) tuples
+    # @return A dictionary of (item_a, item_b) Menu item tuples and the amount of
+    # times the pair was sold together
+    @staticmethod
+    def countPairs(basket):
+        amounts = dict()
+        items = dict()
+        for item, amount in basket:
+            amounts[item.name] = amounts.get(item.name, 0) + amount
+            if item.name not in items or item.pk < items[item.name].pk:
+                items[item.name] = item
+
+        names = sorted(amounts)
+        pairs = dict()
+        for i, a in enumerate(names):
+            if amounts[a] > 1:
+                pairs[(items[a], items[a])] = amounts[a] * (amounts[a] - 1) // 2
+            for b in names[i+1:]:
+                pairs[(items[a], items[b])] = amounts[a] * amounts[b]
+
+        return pairs
+
+    ##
+    # @brief Add the given amounts to the SalesPair table
+    #
+    # Every pair is inserted or added to in a single INSERT ... ON CONFLICT statement,
+    # so pairs from many orders can be written at once.
+    #
+    # @param pairs An iterable of (date, item_a, item_b, amount) tuples, where the
+    # items are Menu items. The items do not have to be sorted by name.
+    @classmethod
+    def addPairs(cls, pairs):
+        rows = dict()
+        for date, i1, i2, amount in pairs:
+            a, b = sorted((i1, i2), key=lambda x: x.name)
+            key = (date, a.name, b.name)
+            if key in rows:
+                row = rows[key]
+                rows[key] = (min(row[0], a.pk), min(row[1], b.pk), row[2] + amount)
+            else:
+                rows[key] = (a.pk, b.pk, amount)
+
+        rows = [(*key, *row) for key, row in rows.items() if row[2] > 0]
+        if len(rows) == 0:
+            return
+
+        dates, a_names, b_names, a_ids, b_ids, amounts = map(list, zip(*rows))
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {cls._meta.db_table} (date, item_a_id, item_a_name, item_b_id, item_b_name, amount)
+                SELECT * FROM UNNEST(%s::date[], %s::bigint[], %s::text[], %s::bigint[], %s::text[], %s::integer[])
+                {cls.upsertSQL()}
+            """, [dates, a_ids, a_names, b_ids, b_names, amounts])
+
+    ##
+    # @brief Add the pairs sold in the given orders to the SalesPair table
+    #
+    # The pairs are counted the same way as countPairs, but entirely in the
+    # database, and written with a single INSERT ... ON CONFLICT statement.
+    #
+    # @param orders A list of Order primary keys
+    @classmethod
+    def addOrders(cls, orders):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                WITH basket AS (
+                    SELECT oi.order_id, o.date, m.name, MIN(m.id) AS menu_id, SUM(oi.amount) AS n
+                    FROM {OrderItem._meta.db_table} oi
+                    JOIN {Order._meta.db_table} o ON o.id = oi.order_id
+                    JOIN {Menu._meta.db_table} m ON m.id = oi.menu_item_id
+                    WHERE oi.order_id = ANY(%(orders)s)
+                    GROUP BY oi.order_id, o.date, m.name
+                )
+                INSERT INTO {cls._meta.db_table} (date, item_a_id, item_a_name, item_b_id, item_b_name, amount)
+                SELECT a.date, MIN(a.menu_id), a.name, MIN(b.menu_id), b.name,
+                       SUM(CASE WHEN a.name = b.name THEN a.n * (a.n - 1) / 2 ELSE a.n * b.n END)
+                FROM basket a
+                JOIN basket b ON b.order_id = a.order_id AND b.name COLLATE "C" >= a.name COLLATE "C"
+                GROUP BY a.date, a.name, b.name
+                HAVING SUM(CASE WHEN a.name = b.name THEN a.n * (a.n - 1) / 2 ELSE a.n * b.n END) > 0
+                {cls.upsertSQL()}
+            """, {'orders': list(orders)})
+
+    ##
+    # @brief The ON CONFLICT clause shared by the SalesPair inserts
+    #
+    # @return An SQL string which adds the amount of conflicting rows
+    @classmethod
+    def upsertSQL(cls):
+        return f"""
+            ON CONFLICT (date, item_a_name, item_b_name) DO UPDATE
+            SET amount = {cls._meta.db_table}.amount + EXCLUDED.amount
+        """
 
     class Meta:
         ## The Constraint that dates, item_a, and item_b must be unique for each instance
@@ -518,11 +988,8 @@ class Menu(Model):
     #
     # @returns A list of 2-tuples of the Menu item ids and sizes
     def getPossibleSizes(self):
-        result = list()
-        for item in Menu.objects.filter(name=self.name):
-            result.append((item.size, item.size))
-
-        return result
+        from .catalog import getCatalog
+        return getCatalog().sizes(self.name)
 
     ##
     # @brief Create a new Menu item
@@ -596,7 +1063,9 @@ class Menu(Model):
     #
     # @returns A dictionary of Inventory item ids and float amounts of the item used
     def getInventoryUsage(self) :
-        return dict(self.ingredient_set.all().values_list('inventory', 'amount'))
+        from .recipes import getRecipes
+        recipes = getRecipes()
+        return recipes.toDict(recipes.usage({self.pk: 1}))
 
     class Meta:
         db_table = 'menu'
@@ -675,11 +1144,8 @@ class OrderItem(Model):
     # 
     # @returns a list of 2-tuples of the Menu item's ID and the size
     def getPossibleSizes(self):
-        result = list()
-        for item in Menu.objects.filter(name=self.menu_item.name):
-            result.append((item.pk, item.size))
-
-        return result
+        from .catalog import getCatalog
+        return [(item.pk, item.size) for item in getCatalog().names.get(self.menu_item.name, ())]
 
     ##
     # @brief Create a new OrderItem
@@ -713,26 +1179,10 @@ class OrderItem(Model):
     ##
     # @brief Get the usage of each Inventory item in the OrderItem
     # 
-    # @return A dictionary of Inventory items and the amount of the item used
-    def getInventoryUsage(self) -> dict[Inventory, float]:
-        # Get Item Usage
-        menu_usage = self.menu_item.getInventoryUsage()
-
-        # Add customization usages
-        for cust in self.itemcustomization_set.all():
-            cust_obj = cust.customization
-
-            if cust_obj.ingredient in menu_usage:
-                menu_usage[cust_obj.ingredient] += cust.amount * cust_obj.amount
-            else:
-                menu_usage[cust_obj.ingredient] = cust_obj.amount * cust.amount
-
-        
-        # Add amount multiplier
-        for key in menu_usage:
-            menu_usage[key] *= self.amount
-
-        return menu_usage
+    # @return A dictionary of Inventory item ids and the amount of the item used
+    def getInventoryUsage(self) -> dict[int, float]:
+        from .recipes import getRecipes
+        return getRecipes().itemUsage(OrderItem.objects.filter(pk=self.pk))
 
     ##
     # @brief Get a querySet of Inventory items annotated with a 'stock_used' column
@@ -785,77 +1235,31 @@ class OrderItem(Model):
 
         return full_usage
 
+    ##
+    # @brief Get the Customizations applied to the item
+    #
+    # @return A list of (Customization id, amount) tuples, in the order they were added
+    def getCustomizationList(self):
+        return list(self.itemcustomization_set.order_by('id').values_list('customization', 'amount'))
+
     ##
     # @brief Returns a list of the prices of each customization applied
     #
     # @return A dictionary with each ItemCustomization applied and the cost 
     # of the customization
     def getPriceList(self):
-        plist = dict()
-
-        foundFoam = False
-        foundSauce = False
-        foundSyrup = False
-
-        custCost = 0.0
-
-        for cust_obj in self.itemcustomization_set.all():
-            cust = cust_obj.customization
-
-            if cust.type.lower() == "syrup":
-                if foundSyrup:
-                    plist[cust_obj] = 0.0
-                else:
-                    foundSyrup = True
-                    plist[cust_obj] = float(cust.cost)
-
-            elif cust.type.lower() == 'sauce':
-                if foundSauce:
-                    plist[cust_obj] = 0.0
-                else:
-                    foundSauce = True
-                    plist[cust_obj] = float(cust.cost)
-            elif cust.type.lower() == 'foam':
-                if foundFoam:
-                    plist[cust_obj] = 0.0
-                else:
-                    foundFoam = True
-                    plist[cust_obj] = float(cust.cost)
-            else:
-                plist[cust_obj] = float(cust.cost)
-
-
-        return plist
-
+        from .pricing import getPricing
+        custs = list(self.itemcustomization_set.order_by('id'))
+        prices = getPricing().customizationPrices([(c.customization_id, c.amount) for c in custs])
+        return dict(zip(custs, prices))
 
     ##
     # @brief Get the total price of all the customizations
     #
     # @returns The total price of all the customizations
     def getCustomizationPrice(self) -> float:
-
-        foundFoam = False
-        foundSauce = False
-        foundSyrup = False
-
-        custCost = 0.0
-
-        for cust in self.itemcustomization_set.all():
-            cust = cust.customization
-
-            if not foundSyrup and cust.type.lower() == "syrup":
-                foundSyrup = True
-                custCost += float(cust.cost)
-            elif not foundSauce and cust.type.lower() == 'sauce':
-                foundSauce = True
-                custCost += float(cust.cost)
-            elif not foundFoam and cust.type.lower() == 'foam':
-                foundFoam = True
-                custCost += float(cust.cost)
-            else:
-                custCost += float(cust.cost)
-
-        return custCost
+        from .pricing import getPricing
+        return getPricing().customizationPrice(self.getCustomizationList())
 
     ##
     # @brief Because the cost is a function of the customizations applied, this retrieves
@@ -870,7 +1274,8 @@ class OrderItem(Model):
     # 
     # @return The item's calculated price
     def calcPrice(self) -> float:
-        self.cost = self.amount * (self.getCustomizationPrice() + float(self.menu_item.price))
+        from .pricing import getPricing
+        self.cost = getPricing().itemPrice(self.menu_item_id, self.amount, self.getCustomizationList())
         self.save()
         return self.getPrice()
 
@@ -880,34 +1285,34 @@ class OrderItem(Model):
     # @param cust The Customization to add
     # @param amount The amount of the customization to add
     def addCustomization(self, cust :Customization, amount :float):
-        if self.itemcustomization_set.filter(customization=cust).count() > 0:
-            self.itemcustomization_set.filter(customization=cust).update(amount=F('amount') + amount)
-        else:
-            newCust = ItemCustomization(order_item=self, customization=cust, amount=amount)
-            newCust.save()
-
-        self.cost = self.amount * (self.getCustomizationPrice() + float(self.menu_item.price))
-        self.save()
-        return
+        self.addCustomizations([cust], amount)
 
     ##
-    # @brief Add one of each customization in custs 
+    # @brief Add the given amount of each customization in custs 
     #
-    # This method is significantly faster than using multiple addCustomization
-    # calls because it performs only 2 SQL queries, no matter how many customizations
-    # are given. This is at worst equal to addCustomization in efficiency
-    # @param custs A list (or other iterable) of Customization objects or primary keys
-    def addCustomizations(self, custs):
-        cust_items = [ ItemCustomization(order_item=self, customization=pair, amount=0) for pair in custs]
-        
-        self.itemcustomization_set.filter(customization__in=custs).update(amount=F('amount')+Value(1))
-        ItemCustomization.objects.bulk_create(cust_items, ignore_conflicts=True)
-
-        self.cost = self.amount * (self.getCustomizationPrice() + float(self.menu_item.price))
-        self.save()
-
-
-
+    # The customizations are added with a single INSERT ... ON CONFLICT, then the
+    # item is re-priced in memory and saved, so this takes 3 queries no matter how
+    # many customizations are given.
+    #
+    # @param custs A list (or other iterable) of Customization objects or primary keys,
+    # or of (Customization or primary key, amount) tuples to add a different amount of each
+    # @param amount The amount of each customization given without an amount
+    def addCustomizations(self, custs, amount=1):
+        counts = dict()
+        for c in custs:
+            c, n = c if isinstance(c, tuple) else (c, amount)
+            counts[getattr(c, 'pk', c)] = counts.get(getattr(c, 'pk', c), 0) + n
+
+        table = ItemCustomization._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (order_item_id, customization_id, amount)
+                SELECT %s, * FROM UNNEST(%s::bigint[], %s::integer[])
+                ON CONFLICT (order_item_id, customization_id) DO UPDATE
+                SET amount = {table}.amount + EXCLUDED.amount
+            """, [self.pk, list(counts), [int(a) for a in counts.values()]])
+
+        self.calcPrice()
 
     class Meta:
         db_table = 'order_items'
@@ -959,6 +1364,18 @@ class ItemCustomization(Model):
             UniqueConstraint(fields=['order_item', 'customization'], name='itemcustomization_single_cust')
             ]
 
+##
+# @brief QuerySet of Order objects
+#
+# Allows a set of orders to be checked out together, e.g.
+# `Order.objects.filter(date=day).checkout()`
+class OrderQuerySet(QuerySet):
+
+    ##
+    # @brief Check out every order in the QuerySet
+    def checkout(self):
+        Order.checkout_many(self)
+
 ##
 # @brief Order Model Class
 # 
@@ -975,23 +1392,26 @@ class Order(Model):
     ## Date that the order was processed
     date = DateField(blank=True, null=True)
 
+    ## Date and time that the order was placed
+    placed = DateTimeField(default=timezone.now, db_index=True)
+
     ## Menu items and Customizations purchased, through the OrderItem model
     items = ManyToManyField(Menu, through='OrderItem')
 
     ## Cost of the order. Added after checkout
     price = DecimalField(null=True, blank=True, max_digits=11, decimal_places=2);
 
+    ## Manager which allows QuerySets of orders to be checked out together
+    objects = OrderQuerySet.as_manager()
+
     ##
     # @brief Get a dictionary of Inventory items and floats which describes the
     # amount of each item used.
     #
-    # @returns A dictionary with the Inventory usage for the order
-    def getInventoryUsage(self) -> dict[Inventory, float]:
-        inv = dict()
-        for item in self.orderitem_set.all():
-            invSum(inv, item.getInventoryUsage())
-
-        return inv
+    # @returns A dictionary of Inventory item ids with the Inventory usage for the order
+    def getInventoryUsage(self) -> dict[int, float]:
+        from .recipes import getRecipes
+        return getRecipes().itemUsage(self.orderitem_set.all())
             
     ##
     # @brief Get the price to restock after this order
@@ -1004,134 +1424,337 @@ class Order(Model):
         return invPrice
 
     ##
-    # @brief Get the price of the order and save it
+    # @brief Calculate the price of each item and of the whole order
+    #
+    # Nothing is written to the DB. The items are priced in memory from the
+    # current price list, using two queries no matter how many items there are.
+    #
+    # @return A tuple of the list of OrderItems and the total price of the order. Each
+    # OrderItem has a 'price' attribute and a 'customization_list' of its 
+    # ItemCustomizations, each of which also has a 'price' attribute.
+    def getTotals(self):
+        from .pricing import getPricing
+        pricing = getPricing()
+
+        items = list(self.orderitem_set.select_related('menu_item').order_by('id'))
+        custs = dict()
+        for cust in ItemCustomization.objects.filter(order_item__order=self).select_related('customization').order_by('id'):
+            custs.setdefault(cust.order_item_id, list()).append(cust)
+
+        total = 0.0
+        for item in items:
+            item.customization_list = custs.get(item.pk, list())
+            cust_list = [(c.customization_id, c.amount) for c in item.customization_list]
+
+            for cust, price in zip(item.customization_list, pricing.customizationPrices(cust_list)):
+                cust.price = price
+
+            item.price = round(pricing.itemPrice(item.menu_item_id, item.amount, cust_list), 2)
+            total += item.price
+
+        return items, round(total, 2)
+
+    ##
+    # @brief Get the price of the order
+    #
+    # This does not write to the DB. Use calcPrice to save the price.
     #
     # @return The price of the order for the customer
     def getPrice(self) -> float:
-        self.price = self.calcPrice()
-        self.save()
-        return round(self.price,2)
+        return self.getTotals()[1]
 
     ##
-    # @brief Force a recalculation of the price of an order
+    # @brief Force a recalculation of the price of an order and save it
     #
-    # Note that this calls calcPrice() for every OrderItem. This
-    # may be a little slow. 
+    # The price of every OrderItem is saved with a single bulk update.
     #
     # @return The calculated the price of the order
     def calcPrice(self) -> float:
-        self.price = 0.0
-        for item in self.orderitem_set.all():
-            self.price += item.calcPrice()
+        items, self.price = self.getTotals()
+        for item in items:
+            item.cost = item.price
+
+        OrderItem.objects.bulk_update(items, ['cost'])
         self.save()
-        return round(self.price, 2)
+        return self.price
 
     ## 
     # @brief Get the Inventory usage for the entire order as a
     # QuerySet of the Inventory table with the 'stock_used' column annotated onto it
+    #
+    # The usage is computed by two grouped subqueries (one for the menu recipes and
+    # one for the customizations), so the SQL does not grow with the size of the order.
     def getInventoryUsageQuerySet(self):
-        query = Q()
-        stmt = Case()
-        for index, item in enumerate(self.orderitem_set.all()):
-            q = item.getInventoryUsageQuerySet()
-            query |= Q(id__in=q.values('id'))
-
-            case_stmt = Case(
-                    When(
-                        id__in=q.values('id'),
-                        then=Subquery(q.filter(id=OuterRef('id')).values('stock_used'))
-                        ),
-                    default=0.0
-                    )
-
-            if index == 0:
-                stmt = case_stmt
-            else:
-                stmt += case_stmt
+        menu_used = OrderItem.objects.filter(
+                order=self,
+                menu_item__ingredient__inventory=OuterRef('id')
+            ).values('order').annotate(
+                total=Sum(F('menu_item__ingredient__amount') * F('amount'))
+            ).values('total')
+
+        cust_used = ItemCustomization.objects.filter(
+                order_item__order=self,
+                customization__ingredient=OuterRef('id')
+            ).values('order_item__order').annotate(
+                total=Sum(F('customization__amount') * F('amount') * F('order_item__amount'))
+            ).values('total')
+
+        return Inventory.objects.annotate(
+                stock_used=Coalesce(Subquery(menu_used), Value(0.0)) +
+                           Coalesce(Subquery(cust_used), Value(0.0))
+            ).filter(stock_used__gt=0)
 
-        return Inventory.objects.filter(query).annotate(stock_used=stmt)
+    ##
+    # @brief Get the SQL which calculates the Inventory usage of a set of orders
+    #
+    # The query sums the recipe of every OrderItem's Menu item and every 
+    # ItemCustomization, multiplied by the amounts ordered, in a single grouped
+    # aggregate. By default it takes a single named parameter, 'orders', which is
+    # a list of Order primary keys, and returns rows of (date, item_id, stock_used). 
+    #
+    # @param orders SQL for the array of Order primary keys to include
+    # @return The SQL string for the aggregate
+    @classmethod
+    def usageSQL(cls, orders="%(orders)s"):
+        return f"""
+            SELECT o.date, u.item_id, SUM(u.stock_used) AS stock_used
+            FROM (
+                SELECT oi.order_id, ing.inventory_id AS item_id, ing.amount * oi.amount AS stock_used
+                FROM {OrderItem._meta.db_table} oi
+                JOIN {Ingredient._meta.db_table} ing ON ing.menu_item_id = oi.menu_item_id
+                WHERE oi.order_id = ANY({orders})
+                UNION ALL
+                SELECT oi.order_id, c.ingredient_id, c.amount * ic.amount * oi.amount
+                FROM {OrderItem._meta.db_table} oi
+                JOIN {ItemCustomization._meta.db_table} ic ON ic.order_item_id = oi.id
+                JOIN {Customization._meta.db_table} c ON c.id = ic.customization_id
+                WHERE oi.order_id = ANY({orders})
+            ) u
+            JOIN {cls._meta.db_table} o ON o.id = u.order_id
+            GROUP BY o.date, u.item_id
+        """
     
+    ##
+    # @brief Place the order and queue it to be checked out
+    #
+    # This only inserts a CheckoutTask. The inventory and sales bookkeeping
+    # is done later by the checkoutworker management command.
+    def place(self):
+        CheckoutTask.enqueue([self])
+
     ##
     # @brief Finalize an order by removing its stock from the Inventory
     # and by placing the Inventory used into the InventoryUsage table.
     #
-    # This function has a portion which runs in Theta(2^n) time. I've 
-    # optimized this as much as possible so that the only section of
-    # code which runs in that awful time is a string join and the creation
-    # of combinations of sold objects.  
+    # This is a batch of one for checkout_many.
     def checkout(self):
-        usage = self.getInventoryUsageQuerySet()
+        Order.checkout_many([self])
 
-        # Create InventoryUsage items
-        usageItems = [InventoryUsage(date=self.date, item=i, amount_used=0.0) for i in usage]
+    ##
+    # @brief Finalize many orders at once
+    #
+    # The Inventory usage, InventoryUsage and CumulativeUsage rows, Finance rows
+    # and SalesPairs of all the orders are aggregated together and applied in two
+    # statements, after locking CumulativeUsage, inside a single transaction. The number of statements does not depend on
+    # the number of orders or on the number of items in each order.
+    #
+    # @param orders An iterable of Order instances or primary keys
+    @classmethod
+    def checkout_many(cls, orders):
+        if isinstance(orders, QuerySet):
+            ids = list(orders.values_list('id', flat=True))
+        else:
+            ids = [getattr(o, 'pk', o) for o in orders]
 
-        # Bulk create (or do nothing) the InventoryUsage 
-        InventoryUsage.objects.bulk_create(usageItems, ignore_conflicts=True)
+        if len(ids) == 0:
+            return
 
-        # Update the inventory usage
-        InventoryUsage.objects.filter(date=self.date, item__in=usage).update(
-                amount_used=F('amount_used') + Subquery(usage.filter(id=OuterRef('item')).values('stock_used'))
+        usage_table = InventoryUsage._meta.db_table
+        inv_table = Inventory._meta.db_table
+        fin_table = Finance._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(CumulativeUsage.lockSQL())
+
+            # Log the usage in InventoryUsage and CumulativeUsage, add the day's 
+            # revenue and expenses to Finance and remove the usage from the 
+            # Inventory stock. The usage is only aggregated once for all of them.
+            cursor.execute(f"""
+                WITH usage AS ({cls.usageSQL()}),
+                {CumulativeUsage.addSQL()},
+                logged AS (
+                    INSERT INTO {usage_table} (date, item_id, amount_used)
+                    SELECT date, item_id, stock_used FROM usage
+                    ON CONFLICT (date, item_id) DO UPDATE
+                    SET amount_used = {usage_table}.amount_used + EXCLUDED.amount_used
+                ),
+                finances AS (
+                    INSERT INTO {fin_table} (date, revenue, expenses, profit, revision)
+                    SELECT date, revenue, expenses, revenue - expenses, 1
+                    FROM ({Finance.totalsSQL()}) totals
+                    ON CONFLICT (date) DO UPDATE
+                    SET revenue = {fin_table}.revenue + EXCLUDED.revenue,
+                        expenses = {fin_table}.expenses + EXCLUDED.expenses,
+                        profit = {fin_table}.revenue + EXCLUDED.revenue - 
+                                 ({fin_table}.expenses + EXCLUDED.expenses),
+                        revision = {fin_table}.revision + 1
                 )
+                UPDATE {inv_table} SET stock = {inv_table}.stock - totals.stock_used
+                FROM (
+                    SELECT item_id, SUM(stock_used) AS stock_used FROM usage GROUP BY item_id
+                ) totals
+                WHERE {inv_table}.id = totals.item_id
+            """, {'orders': ids})
 
-        # print("Usage Calculated")
-            
-        # Update the Inventory stock
-        usage.update(stock=F('stock')-F('stock_used'))
+            # Add purchased pairs to the SalesPairs table
+            SalesPair.addOrders(ids)
 
-        # print("Stock Updated")
+    ##
+    # @brief Create a new order
+    #
+    # @param cashier The name of the cashier
+    # @param date The date or time at which the order was placed. Defaults to now
+    # @return The new Order item created
+    @classmethod
+    def create(cls, cashier :str, date = None):
+        placed = timezone.now() if date is None else date
+        if not isinstance(placed, datetime.datetime):
+            placed = datetime.datetime.combine(placed, datetime.time())
+        if timezone.is_naive(placed):
+            placed = timezone.make_aware(placed)
+
+        ordr = cls(cashier=cashier, date=timezone.localdate(placed), placed=placed, price=0)
+        ordr.save()
+        return ordr
 
-        # Add purchased pairs to the SalesPairs table
 
-        sorted_items = self.items.order_by('id').all()
-        num_items = self.items.count()
-        if num_items < 2:
-            return
-        combos = list()
-        arr = '('
+    class Meta:
+        db_table = 'orders'
 
-        # Create all combinations of items
-        # Also create a string with an SQL array of pairs of Menu items
-        for i in range(num_items-1):
-            for j in range(i+1,num_items):
-                combos.append((sorted_items[i],sorted_items[j]))
-                arr += f"({sorted_items[i].pk},{sorted_items[j].pk})"
-                if not (i == num_items-2 and j == num_items-1):
-                    arr += ','
-        arr += ')'
+    def __str__(self):
+        return f"{self.date}"
 
-        combonames = list(map(lambda x: list(map(lambda y: y.name, x)), zip(*combos)))
+##
+# @brief Queue of placed orders which are waiting to be checked out
+#
+# Placing an order only inserts a row into this table. The checkoutworker
+# management command drains the queue in batches, checking out every order of
+# a batch with Order.checkout_many and marking the tasks as done in the same
+# transaction. A batch which fails is rolled back and retried later, so every
+# order is checked out exactly once even if the worker dies mid-batch.
+class CheckoutTask(Model):
+    ## The Order to check out. Orders can only be queued once
+    order = OneToOneField(Order, on_delete=CASCADE, primary_key=True)
 
-        # Create all SalesPair objects that don't already exist
-        SalesPair.objects.bulk_create([SalesPair(date=self.date, item_a_name=p[0].name, item_a=p[0], item_b=p[1], item_b_name=p[1].name, amount=0) for p in combos], ignore_conflicts=True)
-        SalesPair.objects.filter(date=self.date, item_a_name__in=combonames[0], item_b_name__in=combonames[1]).update(amount=F('amount')+Value(1))
+    ## When the order was placed
+    created = DateTimeField(default=timezone.now)
 
-        ## Raw SQL Update
+    ## The earliest time that the task may be run. Pushed back after a failure
+    available = DateTimeField(default=timezone.now)
 
-        # Add 1 to every SalesPair involved in this order
-        # with connection.cursor() as cursor:
-        #     cursor.execute("UPDATE storefront_salespair SET amount=amount+1 WHERE (item_a_id, item_b_id) IN " + arr)
- 
-        # print("SalesPairs Added")
+    ## The number of failed attempts at checking out the order
+    attempts = IntegerField(default=0)
 
+    ## When the order was checked out, or null if it hasn't been yet
+    done = DateTimeField(blank=True, null=True)
+
+    ## The error from the last failed attempt
+    error = TextField(blank=True, default='')
 
     ##
-    # @brief Create a new order
+    # @brief Queue the given orders to be checked out
     #
-    # @param cashier The name of the cashier
-    # @param date The date at which the order was placed
-    # @return The new Order item created
+    # Orders which are already queued are ignored. This is a single INSERT.
+    #
+    # @param orders An iterable of Order instances or primary keys
     @classmethod
-    def create(cls, cashier :str, date = datetime.datetime.now()):
-        ordr = cls(cashier=cashier, date=date, price=0)
-        ordr.save()
-        return ordr
+    def enqueue(cls, orders):
+        cls.objects.bulk_create(
+                [cls(order_id=getattr(o, 'pk', o)) for o in orders], 
+                ignore_conflicts=True)
 
+    ##
+    # @brief Check out a batch of queued orders
+    #
+    # The tasks are locked with SKIP LOCKED, so several workers can drain the
+    # queue at once. If the batch fails, each order is retried on its own so
+    # that one bad order does not hold back the others. Orders which fail are
+    # retried after an exponential backoff, until max_attempts is reached.
+    #
+    # @param batch_size The maximum number of orders to check out
+    # @param max_attempts The number of attempts before an order is given up on
+    # @return The number of tasks which were run
+    @classmethod
+    def process(cls, batch_size=100, max_attempts=5):
+        now = timezone.now()
+        with transaction.atomic():
+            tasks = list(cls.objects.select_for_update(skip_locked=True).filter(
+                    done=None, attempts__lt=max_attempts, available__lte=now
+                ).order_by('available')[:batch_size])
+
+            if len(tasks) == 0:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    Order.checkout_many([t.order_id for t in tasks])
+                done = tasks
+            except Exception:
+                done = list()
+                for task in tasks:
+                    try:
+                        with transaction.atomic():
+                            Order.checkout_many([task.order_id])
+                        done.append(task)
+                    except Exception as e:
+                        task.attempts += 1
+                        task.available = now + datetime.timedelta(seconds=2 ** task.attempts)
+                        task.error = repr(e)
+                        task.save(update_fields=['attempts', 'available', 'error'])
+
+            cls.objects.filter(pk__in=[t.pk for t in done]).update(done=now)
+
+        return len(tasks)
 
-    class Meta:
-        db_table = 'orders'
+    def __str__(self):
+        return f"Checkout of order {self.order_id}"
+
+##
+# @brief Version counters for tables which are cached in memory
+#
+# Each row counts the changes made to a group of tables, such as 'recipes'.
+# Processes which keep those tables in memory compare the counter to the 
+# version they loaded to know when they have to reload.
+class CacheVersion(Model):
+    ## The name of the group of tables
+    name = TextField(primary_key=True)
+
+    ## The number of times the tables have changed
+    version = BigIntegerField(default=0)
+
+    ##
+    # @brief Get the current version of the given group of tables
+    #
+    # @param name The name of the group
+    # @return The version, or 0 if the tables have never changed
+    @classmethod
+    def get(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+    ##
+    # @brief Increment the version of the given group of tables
+    #
+    # @param name The name of the group
+    @classmethod
+    def bump(cls, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {cls._meta.db_table} (name, version) VALUES (%s, 1)
+                ON CONFLICT (name) DO UPDATE SET version = {cls._meta.db_table}.version + 1
+            """, [name])
 
     def __str__(self):
-        return f"{self.date}"
+        return f"{self.name} v{self.version}"
 
 ##
 # @brief Add two Inventory dictionaries
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .catalog import getCatalogVersion
+
+##
+# @brief A cache of whole rendered pages which only depend on the catalog
+#
+# The menu pages are the same for every visitor, except for the header, which
+# differs between anonymous visitors, customers and staff. A page is cached in
+# the Django cache by its name, its full path, that kind of visitor and the
+# version of the catalog, so it is shared by every visitor of the same kind and
+# is never stale: a change to the catalog changes the key. The cart badge is not
+# part of the cached HTML, it is shown from the cart-count cookie (see
+# CartCountMiddleware).
+#
+# Pages are rendered with `cached_page` set in their context, which base.html
+# uses to leave out anything per visitor, like the CSRF token.
+#
+# Use getPageCache() to get the cache of this process.
+class PageCache():
+
+    ##
+    # @brief Create a page cache
+    #
+    # @param timeout The seconds a page is kept in the Django cache
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.hits = dict()
+        self.misses = dict()
+
+    ##
+    # @brief Get the key of a page
+    #
+    # @param request The request for the page
+    # @param page The name of the page
+    # @return The key of the page in the Django cache
+    def key(self, request, page):
+        user = request.user
+        visitor = 'staff' if user.is_staff else 'user' if user.is_authenticated else 'anon'
+        parts = (page, getCatalogVersion(), visitor, request.get_full_path())
+        return 'page:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    ##
+    # @brief Get a page, rendering it if it is not cached
+    #
+    # Only successful GET requests are cached.
+    #
+    # @param request The request for the page
+    # @param page The name of the page, used in the key and the stats
+    # @param build A function taking no arguments which renders the page and
+    # returns the response, e.g. `lambda: render(request, template, context)`
+    # @return The response
+    def get(self, request, page, build):
+        if request.method != 'GET':
+            return build()
+
+        key = self.key(request, page)
+        content = cache.get(key)
+        with self.lock:
+            counts = self.hits if content is not None else self.misses
+            counts[page] = counts.get(page, 0) + 1
+
+        if content is not None:
+            return HttpResponse(content)
+
+        response = build()
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        if response.status_code == 200:
+            cache.set(key, response.content, self.timeout)
+        return response
+
+    ##
+    # @brief Get the hit and miss counters of each page
+    #
+    # @return A dictionary of page names and dictionaries of the counters, with
+    # the totals of every page under 'all'
+    def stats(self):
+        with self.lock:
+            pages = sorted(set(self.hits) | set(self.misses))
+            counts = {page: (self.hits.get(page, 0), self.misses.get(page, 0)) for page in pages}
+
+        counts['all'] = (sum(h for h, m in counts.values()), sum(m for h, m in counts.values()))
+        return {page: {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses > 0 else 0.0,
+        } for page, (hits, misses) in counts.items()}
+
+
+page_cache = PageCache(getattr(settings, 'PAGE_CACHE_SECONDS', 60 * 60))
+
+##
+# @brief Get the page cache of this process
+#
+# @return The PageCache
+def getPageCache():
+    return page_cache
@@ -0,0 +1,96 @@
+from .models import Customization, Menu
+from .versioned import Versioned
+
+##
+# @brief In-memory price list of the Menu and the Customizations
+#
+# Prices whole items or carts without touching the DB. The price rules are:
+# an item costs its Menu price plus the cost of each Customization added to it,
+# times the amount of the item ordered. Only the first syrup, the first sauce
+# and the first foam on an item are charged, the rest are free.
+#
+# Use getPricing() to get the current price list instead of creating this class.
+class PriceList():
+
+    ## Customization types where only the first one added to an item is charged
+    FIRST_CHARGED = ('syrup', 'sauce', 'foam')
+
+    ##
+    # @brief Create a price list
+    #
+    # @param menu A dictionary of Menu item ids and prices
+    # @param customizations A dictionary of Customization ids and (cost, type) tuples
+    def __init__(self, menu, customizations):
+        self.menu = menu
+        self.customizations = {c: (cost, type.lower()) for c, (cost, type) in customizations.items()}
+
+    ##
+    # @brief Load the price list from the DB
+    #
+    # @return A new PriceList
+    @classmethod
+    def load(cls):
+        return cls(
+            {m: float(price) for m, price in Menu.objects.values_list('id', 'price')},
+            {c: (float(cost), type) for c, cost, type in Customization.objects.values_list('id', 'cost', 'type')},
+        )
+
+    ##
+    # @brief Get the price of each customization added to an item
+    #
+    # @param customizations A list of (Customization id, amount) tuples, in the
+    # order that they were added to the item
+    # @return A list with the price of each customization, in the same order
+    def customizationPrices(self, customizations):
+        charged = set()
+        prices = list()
+        for cust, amount in customizations:
+            cost, type = self.customizations[cust]
+            if type in self.FIRST_CHARGED:
+                if type in charged:
+                    cost = 0.0
+                charged.add(type)
+            prices.append(cost)
+
+        return prices
+
+    ##
+    # @brief Get the price of the customizations added to an item
+    #
+    # @param customizations A list of (Customization id, amount) tuples
+    # @return The total price of the customizations for one of the item
+    def customizationPrice(self, customizations):
+        return sum(self.customizationPrices(customizations))
+
+    ##
+    # @brief Get the price of a configured item
+    #
+    # @param menu_item The Menu item id
+    # @param amount The amount of the item ordered
+    # @param customizations A list of (Customization id, amount) tuples
+    # @return The price of the item to the customer
+    def itemPrice(self, menu_item, amount, customizations=()):
+        return amount * (self.menu[menu_item] + self.customizationPrice(customizations))
+
+    ##
+    # @brief Get the price of a whole cart
+    #
+    # @param items An iterable of (Menu item id, amount, customizations) tuples, where
+    # customizations is a list of (Customization id, amount) tuples
+    # @return A tuple of the list of prices of each item and the total price
+    def cartPrice(self, items):
+        prices = [self.itemPrice(*item) for item in items]
+        return prices, round(sum(prices), 2)
+
+
+pricing = Versioned('catalog', PriceList.load)
+
+##
+# @brief Get the current price list
+#
+# The price list is loaded once per process and reloaded when a Menu item
+# or Customization changes.
+#
+# @return The current PriceList
+def getPricing():
+    return pricing.get()
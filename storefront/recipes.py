@@ -0,0 +1,164 @@
+import numpy as np
+
+from django.db.models import F, Sum
+
+from .models import Customization, Ingredient, Inventory, ItemCustomization, OrderItem
+from .versioned import Versioned
+
+##
+# @brief In-memory recipe matrices for calculating Inventory usage
+#
+# The recipes of the Menu items and Customizations are held as two matrices,
+# Menu x Inventory (built from Ingredient) and Customization x Inventory (built
+# from Customization.ingredient and Customization.amount). The Inventory used by
+# any number of items is then a vector-matrix product of the amount of each Menu
+# item and Customization sold with the recipe matrices.
+#
+# Use getRecipes() to get the current matrices instead of creating this class.
+class RecipeMatrix():
+
+    ##
+    # @brief Create the recipe matrices
+    #
+    # @param inventory A list of the Inventory item ids, one per column
+    # @param ingredients An iterable of (menu id, inventory id, amount) tuples
+    # @param customizations An iterable of (customization id, inventory id, amount) tuples
+    def __init__(self, inventory, ingredients, customizations):
+        ## The Inventory item ids of each column
+        self.inventory = np.array(inventory, dtype=np.int64)
+        self.inventory_index = {inv: col for col, inv in enumerate(inventory)}
+
+        ingredients = list(ingredients)
+        customizations = list(customizations)
+
+        ## The row of each Menu item id in the menu matrix
+        self.menu_index = {m: row for row, m in enumerate(sorted({i[0] for i in ingredients}))}
+
+        ## The row of each Customization id in the customization matrix
+        self.cust_index = {c: row for row, c in enumerate(sorted({c[0] for c in customizations}))}
+
+        ## Grams of each Inventory item used by one of each Menu item
+        self.menu = self._matrix(self.menu_index, ingredients)
+
+        ## Grams of each Inventory item used by one of each Customization
+        self.cust = self._matrix(self.cust_index, customizations)
+
+    def _matrix(self, index, recipes):
+        matrix = np.zeros((len(index), len(self.inventory)))
+        for key, inv, amount in recipes:
+            matrix[index[key], self.inventory_index[inv]] += amount
+        return matrix
+
+    ##
+    # @brief Load the recipe matrices from the DB
+    #
+    # @return A new RecipeMatrix
+    @classmethod
+    def load(cls):
+        return cls(
+            list(Inventory.objects.order_by('id').values_list('id', flat=True)),
+            Ingredient.objects.values_list('menu_item', 'inventory', 'amount'),
+            Customization.objects.values_list('id', 'ingredient', 'amount'),
+        )
+
+    ##
+    # @brief Turn a dictionary of ids and amounts into a vector of amounts
+    #
+    # Ids which are not in the index (i.e. that use no Inventory) are ignored.
+    #
+    # @param index The row index of the matrix
+    # @param counts A dictionary of ids and amounts
+    # @return A vector with the amount of each row
+    @staticmethod
+    def vector(index, counts):
+        vec = np.zeros(len(index))
+        for key, amount in counts.items():
+            if key in index:
+                vec[index[key]] += amount
+        return vec
+
+    ##
+    # @brief Calculate the Inventory used by the given amounts of items
+    #
+    # @param menu_counts A dictionary of Menu item ids and the amount sold
+    # @param cust_counts A dictionary of Customization ids and the amount sold
+    # @return A vector of the grams of each Inventory item used, in the order of self.inventory
+    def usage(self, menu_counts, cust_counts=dict()):
+        return (self.vector(self.menu_index, menu_counts) @ self.menu +
+                self.vector(self.cust_index, cust_counts) @ self.cust)
+
+    ##
+    # @brief Calculate the Inventory used by many groups of items at once
+    #
+    # Each row of the count matrices is a separate group (e.g. an order or a day),
+    # so the usage of every group is calculated with two matrix products.
+    #
+    # @param menu_counts An N x Menu matrix of the amount of each Menu item sold
+    # @param cust_counts An N x Customization matrix of the amount of each Customization sold
+    # @return An N x Inventory matrix of the grams of each Inventory item used
+    def usageMany(self, menu_counts, cust_counts):
+        return menu_counts @ self.menu + cust_counts @ self.cust
+
+    ##
+    # @brief Calculate the Inventory used by each group of a grouped aggregate
+    #
+    # The rows are turned into count matrices, with one row per group, and the
+    # usage of all the groups is calculated at once with usageMany().
+    #
+    # @param menu_rows An iterable of (group, Menu item id, amount sold) tuples
+    # @param cust_rows An iterable of (group, Customization id, amount sold) tuples
+    # @return A tuple of the sorted list of groups and a Groups x Inventory matrix of the grams used
+    def groupUsage(self, menu_rows, cust_rows):
+        menu_rows = list(menu_rows)
+        cust_rows = list(cust_rows)
+        groups = sorted({row[0] for row in menu_rows} | {row[0] for row in cust_rows})
+        group_index = {group: row for row, group in enumerate(groups)}
+
+        menu_counts = np.zeros((len(groups), len(self.menu_index)))
+        for group, menu_item, amount in menu_rows:
+            if menu_item in self.menu_index:
+                menu_counts[group_index[group], self.menu_index[menu_item]] += amount
+
+        cust_counts = np.zeros((len(groups), len(self.cust_index)))
+        for group, cust, amount in cust_rows:
+            if cust in self.cust_index:
+                cust_counts[group_index[group], self.cust_index[cust]] += amount
+
+        return groups, self.usageMany(menu_counts, cust_counts)
+
+    ##
+    # @brief Convert a usage vector into a dictionary
+    #
+    # @param usage A vector returned by usage()
+    # @return A dictionary of Inventory ids and the grams used, without unused items
+    def toDict(self, usage):
+        nonzero = np.flatnonzero(usage)
+        return dict(zip(self.inventory[nonzero].tolist(), usage[nonzero].tolist()))
+
+    ##
+    # @brief Calculate the Inventory used by a set of OrderItems
+    #
+    # This takes two grouped queries, no matter how many OrderItems there are.
+    #
+    # @param items A QuerySet of OrderItems
+    # @return A dictionary of Inventory ids and the grams used
+    def itemUsage(self, items):
+        menu_counts = dict(items.order_by().values_list('menu_item').annotate(n=Sum('amount')))
+        cust_counts = dict(ItemCustomization.objects.filter(order_item__in=items.values('id'))
+                           .order_by().values_list('customization')
+                           .annotate(n=Sum(F('amount') * F('order_item__amount'))))
+
+        return self.toDict(self.usage(menu_counts, cust_counts))
+
+
+recipes = Versioned('recipes', RecipeMatrix.load)
+
+##
+# @brief Get the current recipe matrices
+#
+# The matrices are loaded once per process and reloaded when a Menu item,
+# Ingredient, Customization or Inventory item changes.
+#
+# @return The current RecipeMatrix
+def getRecipes():
+    return recipes.get()
@@ -0,0 +1,130 @@
+import datetime
+import pickle
+import threading
+from collections import namedtuple
+
+from cachetools import LRUCache
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import CacheVersion, Finance
+
+##
+# @brief An in-memory cache of analytics reports
+#
+# Reports are keyed by the name of the report, its parameters and its date range.
+# A report over days which are all closed (before yesterday, so that orders still
+# in the checkout queue at midnight have been processed) never changes, so it is
+# returned without any queries. A report whose range includes a recent day is stamped
+# with the Finance revisions of its days, which checkout increases, and is only
+# rebuilt once a checkout touched one of those days. Reports which depend on
+# something other than orders (e.g. the Inventory stock) can also be stamped
+# with CacheVersion counters.
+#
+# The cache is limited to REPORT_CACHE_BYTES of pickled reports, and the least
+# recently used reports are evicted first. Use getReportCache() to get the cache
+# of this process.
+class ReportCache():
+
+    Entry = namedtuple('Entry', ['value', 'stamp', 'size'])
+
+    ##
+    # @brief Create an empty cache
+    #
+    # @param max_bytes The maximum total size of the cached reports, in bytes
+    def __init__(self, max_bytes):
+        self.entries = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: entry.size)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    ##
+    # @brief Get a report, building it if it is not cached or has changed
+    #
+    # @param report The name of the report
+    # @param params A tuple of the parameters of the report, other than the dates
+    # @param start The first day of the report, or None for every day before end
+    # @param end The last day of the report, or None for every day after start
+    # @param build A function taking no arguments which builds the report. The
+    # report must be picklable, so QuerySets should be turned into lists.
+    # @param versions The names of the CacheVersion counters the report depends on
+    # @return The report
+    def get(self, report, params, start, end, build, versions=()):
+        start = self._date(start)
+        end = self._date(end)
+        key = (report, tuple(params), start, end)
+        stamp = self.stamp(start, end, versions)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.stamp == stamp:
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+
+        # Build outside of the lock, so one slow report does not block the others
+        value = build()
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            if size <= self.entries.maxsize:
+                self.entries[key] = self.Entry(value, stamp, size)
+
+        return value
+
+    ##
+    # @brief Get the stamp which changes whenever a report over the range may change
+    #
+    # @param start The first day of the range, or None
+    # @param end The last day of the range, or None
+    # @param versions The names of the CacheVersion counters to include
+    # @return None for ranges of closed days, otherwise a tuple of the revisions and versions
+    def stamp(self, start, end, versions=()):
+        closed = datetime.date.fromordinal(timezone.localdate().toordinal() - 1)
+        if end is not None and end < closed and len(versions) == 0:
+            return None
+
+        finances = Finance.objects.all()
+        if start is not None:
+            finances = finances.filter(date__gte=start)
+        if end is not None:
+            finances = finances.filter(date__lte=end)
+
+        return (finances.aggregate(revision=Sum('revision'))['revision'],
+                tuple(CacheVersion.get(name) for name in versions))
+
+    ##
+    # @brief Get the hit and miss counters and the size of the cache
+    #
+    # @return A dictionary of the counters
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total > 0 else 0.0,
+                'reports': len(self.entries),
+                'bytes': self.entries.currsize,
+                'max_bytes': self.entries.maxsize,
+            }
+
+    ##
+    # @brief Remove every report from the cache
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def _date(day):
+        return None if day is None else datetime.date.fromisoformat(str(day))
+
+
+report_cache = ReportCache(getattr(settings, 'REPORT_CACHE_BYTES', 32 * 1024 * 1024))
+
+##
+# @brief Get the report cache of this process
+#
+# @return The ReportCache
+def getReportCache():
+    return report_cache
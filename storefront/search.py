@@ -0,0 +1,123 @@
+import bisect
+import re
+import threading
+
+from .catalog import getCatalog
+
+##
+# @brief Split text into lowercase words
+#
+# @param text The text to split
+# @return A list of words
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", (text or '').lower())
+
+##
+# @brief In-memory inverted index of the drinks in the catalog
+#
+# Every word of the name and description of each drink is mapped to the drinks
+# it appears in, with a weight: words of the name weigh more than words of the
+# description. The words are also kept sorted, so the words starting with a
+# prefix are found with a binary search. A query matches the drinks which contain
+# every word of the query, either as a whole word or as the start of a word, and
+# the drinks are ranked by the sum of the weights of the words they matched.
+#
+# Use getSearchIndex() to get the index of the current catalog instead of creating this class.
+class SearchIndex():
+
+    ## The weight of a word in the name and in the description of a drink
+    NAME_WEIGHT = 3.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    ## The weight of a word matched by a prefix, relative to a whole word
+    PREFIX_FACTOR = 0.5
+
+    ##
+    # @brief Build the index
+    #
+    # @param items An iterable of Menu items, ordered by id
+    def __init__(self, items):
+        self.items = tuple(items)
+        ## The drinks each word appears in, as a dictionary of item positions and weights
+        self.postings = dict()
+        for pos, item in enumerate(self.items):
+            for words, weight in ((tokenize(item.name), self.NAME_WEIGHT),
+                                  (tokenize(item.description), self.DESCRIPTION_WEIGHT)):
+                for word in words:
+                    posting = self.postings.setdefault(word, dict())
+                    posting[pos] = max(posting.get(pos, 0.0), weight)
+
+        self.words = sorted(self.postings)
+
+    ##
+    # @brief Build the index of the drinks in a catalog
+    #
+    # Only one size of each drink is indexed, the same ones the search page shows.
+    #
+    # @param catalog The Catalog
+    # @param sizes The sizes to index (lowercase)
+    # @return A new SearchIndex
+    @classmethod
+    def fromCatalog(cls, catalog, sizes=('grande', 'doppio')):
+        return cls(item for item in catalog.items if item.size.lower() in sizes)
+
+    ##
+    # @brief Get the weight of each drink for one word of a query
+    #
+    # @param word The word, lowercase
+    # @return A dictionary of item positions and weights
+    def _match(self, word):
+        scores = dict(self.postings.get(word, dict()))
+        start = bisect.bisect_left(self.words, word)
+        for other in self.words[start:]:
+            if not other.startswith(word):
+                break
+            if other == word:
+                continue
+            for pos, weight in self.postings[other].items():
+                scores[pos] = max(scores.get(pos, 0.0), weight * self.PREFIX_FACTOR)
+        return scores
+
+    ##
+    # @brief Find the drinks matching a query, best first
+    #
+    # @param query The text of the query
+    # @param limit The most drinks to return, or None for every match
+    # @return A list of Menu items. Every drink is returned, by id, for an empty query.
+    def search(self, query, limit=None):
+        words = tokenize(query)
+        if len(words) == 0:
+            return list(self.items[:limit])
+
+        scores = None
+        for word in words:
+            match = self._match(word)
+            if scores is None:
+                scores = match
+            else:
+                scores = {pos: score + match[pos] for pos, score in scores.items() if pos in match}
+            if len(scores) == 0:
+                return list()
+
+        ranked = sorted(scores, key=lambda pos: (-scores[pos], self.items[pos].name, pos))
+        return [self.items[pos] for pos in ranked[:limit]]
+
+
+search_index = None
+search_index_lock = threading.Lock()
+
+##
+# @brief Get the search index of the current catalog
+#
+# The index is built the first time it is used, and rebuilt when the catalog is
+# reloaded.
+#
+# @return A SearchIndex
+def getSearchIndex():
+    global search_index
+    catalog = getCatalog()
+
+    with search_index_lock:
+        if search_index is None or search_index[0] is not catalog:
+            search_index = (catalog, SearchIndex.fromCatalog(catalog))
+        return search_index[1]
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+
+from .models import Customization, Ingredient, Inventory, Menu
+from .versioned import Versioned
+
+##
+# @brief Models whose changes affect each CacheVersion group
+VERSIONED_MODELS = {
+    'recipes': (Menu, Ingredient, Customization, Inventory),
+    'catalog': (Menu, Customization, Ingredient, Inventory),
+}
+
+##
+# @brief Connect the signals which keep the CacheVersion counters current
+#
+# Called from StorefrontConfig.ready()
+def connect():
+    for name, models in VERSIONED_MODELS.items():
+        def changed(sender, name=name, **kwargs):
+            Versioned.changed(name)
+
+        for model in models:
+            post_save.connect(changed, sender=model, weak=False, dispatch_uid=f"{name}-{model.__name__}-save")
+            post_delete.connect(changed, sender=model, weak=False, dispatch_uid=f"{name}-{model.__name__}-delete")
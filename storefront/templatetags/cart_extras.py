@@ -0,0 +1,16 @@
+from django import template
+
+register = template.Library()
+
+##
+# @brief Calculate the prices of an order once for the whole template
+#
+# Use as `{% order_totals order as totals %}`, then loop over `totals.items`
+# and show `totals.total`. Nothing is written to the DB.
+#
+# @param order The Order or Cart to price
+# @return A dictionary with the priced 'items' and the 'total' price
+@register.simple_tag
+def order_totals(order):
+    items, total = order.getTotals()
+    return {'items': items, 'total': total}
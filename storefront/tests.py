@@ -1,4 +1,24 @@
 from django.test import TestCase, SimpleTestCase
+from .models import *
+from .recipes import RecipeMatrix
+from .pricing import PriceList
+from .topk import SpaceSaving
+from .reports import ReportCache
+from . import exports
+from .forecast import StockForecast
+from .baskets import FPTree
+from . import api
+from .catalog import Catalog
+from .forms import buildCustomizationForm
+from .views import _configuration
+from .search import SearchIndex
+from .pagecache import PageCache
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory
+from unittest import mock
+import decimal
+import numpy as np
 
 class SimpleTests(SimpleTestCase):
     # tests to see if the status code returned by the home
@@ -7,3 +27,312 @@ class SimpleTests(SimpleTestCase):
         response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
         
+
+class SalesPairTests(SimpleTestCase):
+    # tests that pairs are counted once per unit ordered, and that items
+    # with the same name (different sizes) count as the same item
+    def test_count_pairs(self):
+        tall = Menu(id=1, name='Latte', size='Tall')
+        grande = Menu(id=2, name='Latte', size='Grande')
+        mocha = Menu(id=3, name='Mocha', size='Grande')
+
+        pairs = SalesPair.countPairs([(grande, 1), (mocha, 2), (tall, 2)])
+
+        self.assertEqual(pairs, {(tall, tall): 3, (tall, mocha): 6, (mocha, mocha): 1})
+
+    def test_count_pairs_single_item(self):
+        self.assertEqual(SalesPair.countPairs([(Menu(id=1, name='Latte'), 1)]), {})
+
+class FrequentReportTests(SimpleTestCase):
+    # tests that the report is grouped, sorted and limited by the DB, not in Python
+    def test_grouped_and_limited(self):
+        report = FinanceView(datetime.date(2022, 1, 1), datetime.date(2022, 1, 31)).sellsTogetherReport(5)
+        sql = str(report.query)
+
+        self.assertIn('GROUP BY', sql)
+        self.assertIn('ORDER BY "total" DESC', sql)
+        self.assertIn('LIMIT 5', sql)
+
+    def test_sort_column_checked(self):
+        finances = FinanceView(datetime.date(2022, 1, 1), datetime.date(2022, 1, 31))
+
+        with self.assertRaises(ValueError):
+            finances.sellsTogetherReportSorted(col='__class__')
+
+class InventoryUsageReportTests(SimpleTestCase):
+    # tests that usage over a range is read from the running totals at its two ends
+    def test_reads_running_totals(self):
+        usage = FinanceView(datetime.date(2022, 1, 1), datetime.date(2022, 12, 31)).getInventoryUsage()
+        sql = str(usage.query)
+
+        self.assertNotIn('storefront_inventoryusage', sql)
+        self.assertIn("""U0."date" <= 2022-12-31""", sql)
+        self.assertIn("""U0."date" <= 2021-12-31""", sql)
+
+class SalesReportTests(SimpleTestCase):
+    # tests that the sizes of a drink are collapsed into one row per name
+    def test_grouped_by_name(self):
+        report = FinanceView(datetime.date(2022, 1, 1), datetime.date(2022, 1, 31)).salesReport('name')
+        sql = str(report.query)
+
+        self.assertIn('GROUP BY "menu"."name"', sql)
+        self.assertIn('SUM("order_items"."amount") AS "units"', sql)
+
+    def test_unknown_group(self):
+        with self.assertRaises(ValueError):
+            FinanceView(datetime.date(2022, 1, 1), datetime.date(2022, 1, 31)).salesReport('size')
+
+class SpaceSavingTests(SimpleTestCase):
+    # tests that counts are exact while there are no more keys than the capacity
+    def test_exact_under_capacity(self):
+        counter = SpaceSaving(3)
+        for key, amount in [('a', 2), ('b', 5), ('a', 4), ('c', 1)]:
+            counter.add(key, amount)
+
+        self.assertEqual(counter.top(2), [('a', 6), ('b', 5)])
+
+    # tests that the smallest key is replaced, and the new key inherits its count
+    def test_replaces_smallest(self):
+        counter = SpaceSaving(2)
+        for key, amount in [('a', 5), ('b', 1), ('c', 2)]:
+            counter.add(key, amount)
+
+        self.assertEqual(len(counter), 2)
+        self.assertEqual(counter.top(2), [('a', 5), ('c', 3)])
+        self.assertEqual(counter.error('c'), 1)
+
+class FPTreeTests(SimpleTestCase):
+    # tests that FP-growth finds every itemset in at least min_count baskets
+    def test_mine(self):
+        tree = FPTree()
+        for basket in [{1, 2, 3}, {1, 2}, {2, 3}, {1, 2, 3, 4}]:
+            tree.insert(basket)
+
+        itemsets = dict(tree.mine(3))
+
+        self.assertEqual(itemsets, {frozenset({1}): 3, frozenset({2}): 4, frozenset({3}): 3,
+                                    frozenset({1, 2}): 3, frozenset({2, 3}): 3})
+
+    # tests that baskets inserted after mining are included, and that sizes are limited
+    def test_insert_and_max_size(self):
+        tree = FPTree()
+        tree.insert({1, 2, 3})
+        tree.insert({1, 2, 3}, count=2)
+
+        itemsets = dict(tree.mine(2, max_size=2))
+
+        self.assertEqual(itemsets[frozenset({1, 3})], 3)
+        self.assertNotIn(frozenset({1, 2, 3}), itemsets)
+
+class ReportCacheTests(SimpleTestCase):
+    # tests that reports over closed days are built once and then never re-checked
+    def test_closed_days_cached(self):
+        cache = ReportCache(10000)
+        builds = list()
+
+        for _ in range(3):
+            report = cache.get('sales', ('item',), '2021-01-01', '2021-01-31', lambda: builds.append(1) or [1, 2])
+
+        self.assertEqual(report, [1, 2])
+        self.assertEqual(len(builds), 1)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (2, 1))
+
+    # tests that the least recently used reports are evicted to stay under the memory cap
+    def test_memory_cap(self):
+        cache = ReportCache(2000)
+        for n in range(5):
+            cache.get('sales', (n,), '2021-01-01', '2021-01-31', lambda: list(range(200)))
+
+        self.assertLessEqual(cache.stats()['bytes'], 2000)
+        self.assertEqual(cache.get('sales', (4,), '2021-01-01', '2021-01-31', lambda: None), list(range(200)))
+        self.assertIsNone(cache.get('sales', (0,), '2021-01-01', '2021-01-31', lambda: None))
+
+class ExportTests(SimpleTestCase):
+    # tests that rows are serialized one line at a time
+    def test_csv(self):
+        rows = [{'name': 'Latte', 'units': 3}, {'name': 'Mocha, Iced', 'units': 1}]
+
+        lines = list(exports.csvLines(['name', 'units'], iter(rows)))
+
+        self.assertEqual(lines, ['name,units\r\n', 'Latte,3\r\n', '"Mocha, Iced",1\r\n'])
+
+    def test_ndjson(self):
+        rows = [{'date': datetime.date(2022, 5, 1), 'cost': decimal.Decimal('4.50')}]
+
+        self.assertEqual(list(exports.ndjson(iter(rows))), [b'{"date":"2022-05-01","cost":"4.50"}\n'])
+
+class RecipeMatrixTests(SimpleTestCase):
+    # tests that usage is the sum of the recipes times the amounts sold
+    def test_usage(self):
+        recipes = RecipeMatrix([1, 2, 3], [(10, 1, 5.0), (10, 2, 1.0), (11, 3, 2.0)], [(20, 2, 3.0)])
+
+        usage = recipes.toDict(recipes.usage({10: 2, 11: 1}, {20: 4}))
+
+        self.assertEqual(usage, {1: 10.0, 2: 14.0, 3: 2.0})
+
+    def test_usage_many(self):
+        recipes = RecipeMatrix([1, 2], [(10, 1, 5.0), (11, 2, 1.0)], [(20, 2, 3.0)])
+
+        usage = recipes.usageMany(np.array([[1, 0], [2, 3]]), np.array([[0], [1]]))
+
+        self.assertEqual(usage.tolist(), [[5.0, 0.0], [10.0, 6.0]])
+
+    # tests that grouped rows are summed into one usage row per group, in order
+    def test_group_usage(self):
+        recipes = RecipeMatrix([1, 2], [(10, 1, 5.0), (11, 2, 1.0)], [(20, 2, 3.0)])
+
+        groups, usage = recipes.groupUsage([('b', 10, 1), ('a', 11, 2), ('b', 11, 1)], [('a', 20, 1)])
+
+        self.assertEqual(groups, ['a', 'b'])
+        self.assertEqual(usage.tolist(), [[0.0, 5.0], [5.0, 1.0]])
+
+class StockForecastTests(SimpleTestCase):
+    # tests that the burn rate is the mean of the last `window` days
+    def test_rolling_mean(self):
+        forecast = StockForecast(datetime.date(2022, 1, 3), [1], [[1], [2], [3], [6]], window=2)
+
+        self.assertEqual(forecast.rollingMean()[:, 0].tolist(), [1.0, 1.5, 2.5, 4.5])
+        self.assertEqual(forecast.burnRates().tolist(), [4.5])
+
+    # tests that days of the week which use more are projected to use more
+    def test_seasonality(self):
+        # Two weeks starting on a Monday, where Saturdays use three times as much
+        usage = [[3.0] if day % 7 == 5 else [1.0] for day in range(14)]
+        forecast = StockForecast(datetime.date(2022, 1, 3), [1], usage, window=14)
+
+        factors = forecast.seasonality()[:, 0]
+        projected = forecast.project(datetime.date(2022, 1, 17), 7)[:, 0]
+
+        self.assertAlmostEqual(factors[5] / factors[0], 3.0)
+        self.assertAlmostEqual(projected.sum(), 7 * forecast.burnRates()[0])
+
+class PriceListTests(SimpleTestCase):
+    # tests that only the first syrup, sauce and foam of an item are charged
+    def test_first_charged(self):
+        prices = PriceList({1: 4.0}, {10: (0.5, 'Syrup'), 11: (0.75, 'syrup'), 12: (0.6, 'milk'), 13: (0.8, 'foam')})
+
+        self.assertEqual(prices.customizationPrices([(10, 2), (12, 1), (11, 1), (13, 1)]), [0.5, 0.6, 0.0, 0.8])
+        self.assertEqual(prices.itemPrice(1, 2, [(10, 2), (11, 1)]), 9.0)
+
+    def test_cart_price(self):
+        prices = PriceList({1: 4.0, 2: 3.25}, {10: (0.5, 'syrup')})
+
+        self.assertEqual(prices.cartPrice([(1, 1, [(10, 1)]), (2, 2, [])]), ([4.5, 6.5], 11.0))
+
+class ApiTests(SimpleTestCase):
+    # tests that cursors round trip the keys of rows, and that bad cursors are rejected
+    def test_cursor(self):
+        for key in ["2022-12-10", ["Cocoa", "Cold Brew"], [7, "Latte", "Grande"]]:
+            self.assertEqual(api.decodeCursor(api.encodeCursor(key)), key)
+
+        with self.assertRaises(api.ApiError):
+            api.decodeCursor("not a cursor")
+
+    def test_params(self):
+        report = api.REPORTS['itemsets']
+        params = api._params(report, {'min_support': '0.5', 'max_size': ''})
+
+        self.assertEqual(params, {'min_support': 0.5, 'min_size': 1, 'max_size': None})
+        with self.assertRaises(api.ApiError):
+            api._params(report, {'min_size': 'two'})
+
+class CatalogTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = Catalog([
+            Menu(id=3, name="Latte", size="Venti", type="espresso", description="", price=5),
+            Menu(id=1, name="Latte", size="Grande", type="Espresso", description="Milk and espresso", price=4),
+            Menu(id=2, name="Mocha", size="Grande", type="espresso", description="Chocolate", price=4),
+            Menu(id=4, name="Chai", size="grande", type="tea", description="Spiced latte", price=4),
+        ], ingredients={1: ["Milk", "Espresso"]})
+
+    # tests that items are grouped by name and type, case insensitively
+    def test_groups(self):
+        self.assertEqual(self.catalog.sizes("Latte"), [("Grande", "Grande"), ("Venti", "Venti")])
+        self.assertEqual(self.catalog.item("Latte", "venti").pk, 3)
+        self.assertEqual([m.pk for m in self.catalog.ofType("ESPRESSO", "grande")], [1, 2])
+        self.assertEqual(self.catalog.description("Latte"), "Milk and espresso")
+        self.assertEqual(self.catalog.ingredients[1], ("Milk", "Espresso"))
+        self.assertIsNone(self.catalog.get(5))
+
+    def test_customization_ids(self):
+        catalog = Catalog([], [Customization(id=5, name="Mocha", type="Sauce"), Customization(id=6, name="Mocha", type="syrup"),
+                               Customization(id=8, name="Oat", type="milk")])
+
+        self.assertEqual(catalog.customizationIds(["Mocha", "Oat", "Soy"]), {"Mocha": 5, "Oat": 8})
+        self.assertEqual(catalog.customizationIds(["Mocha", "Oat"], "SYRUP"), {"Mocha": 6})
+
+class CustomizationFormTests(SimpleTestCase):
+    # tests that amount forms get a field per Customization and return their ids
+    def test_amount_form(self):
+        custs = [Customization(id=7, name="Brown Sugar", type="syrup"), Customization(id=9, name="Sugar-free Vanilla", type="syrup")]
+        form = buildCustomizationForm("syrup", custs)({"Brown_Sugar": "2", "Sugar_free_Vanilla": "0"})
+
+        self.assertEqual(list(form.base_fields), ["Brown_Sugar", "Sugar_free_Vanilla"])
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.selected(), [(7, 2)])
+
+    def test_multiple_form(self):
+        custs = [Customization(id=3, name="Whip", type="topping"), Customization(id=4, name="Cinnamon", type="topping")]
+        form = buildCustomizationForm("topping", custs)({"topping": ["3", "4"]})
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.selected(), [(3, 1), (4, 1)])
+
+class ConfigureItemTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = Catalog([Menu(id=1, name="Latte", size="Grande", type="espresso"),
+                                Menu(id=2, name="Latte", size="Venti", type="espresso")],
+                               [Customization(id=5, name="Vanilla", type="syrup"), Customization(id=6, name="Shot", type="coffee")])
+
+    # tests that a whole configuration is resolved, and that left out keys keep the current values
+    def test_configuration(self):
+        item = self.catalog.get(1)
+        data = {"size": "venti", "customizations": [{"name": "Vanilla", "type": "syrup", "amount": 2}, {"id": 6}]}
+
+        self.assertEqual(_configuration(self.catalog, item, data, [1, 3, []]), (self.catalog.get(2), 3, [(5, 2), (6, 1)]))
+        self.assertEqual(_configuration(self.catalog, item, {}, [1, 2, [[5, 1]]]), (item, 2, [(5, 1)]))
+
+    def test_invalid(self):
+        item = self.catalog.get(1)
+        for data in [{"size": "Trenta"}, {"amount": 0}, {"customizations": [{"id": 6, "amount": 4}]},
+                     {"customizations": [{"name": "Vanilla", "type": "sauce"}]}]:
+            with self.assertRaises(ValueError):
+                _configuration(self.catalog, item, data, None)
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex([
+            Menu(id=1, name="Caffe Latte", description="Espresso with steamed milk"),
+            Menu(id=2, name="Chai Tea Latte", description="Spiced black tea"),
+            Menu(id=3, name="Caramel Macchiato", description="Vanilla, milk and caramel"),
+        ])
+
+    # tests that every word must match, and that the last word can be a prefix
+    def test_prefix(self):
+        self.assertEqual([m.pk for m in self.index.search("latte")], [1, 2])
+        self.assertEqual([m.pk for m in self.index.search("car")], [3])
+        self.assertEqual([m.pk for m in self.index.search("latte tea")], [2])
+        self.assertEqual(self.index.search("latte caramel"), [])
+
+    # tests that words of the name rank above words of the description
+    def test_rank(self):
+        self.assertEqual([m.pk for m in self.index.search("milk")], [1, 3])
+        self.assertEqual([m.pk for m in self.index.search("espresso")], [1])
+        self.assertEqual([m.pk for m in self.index.search("c", limit=2)], [1, 3])
+
+class PageCacheTests(SimpleTestCase):
+    # tests that pages are rendered once per catalog version, and counted in the stats
+    def test_catalog_version(self):
+        pages = PageCache(60)
+        request = RequestFactory().get('/menu/drinks/tea')
+        request.user = AnonymousUser()
+        renders = list()
+        build = lambda: renders.append(1) or HttpResponse(f"page {len(renders)}")
+
+        with mock.patch('storefront.pagecache.getCatalogVersion', return_value=1):
+            self.assertEqual(pages.get(request, 'test', build).content, b"page 1")
+            self.assertEqual(pages.get(request, 'test', build).content, b"page 1")
+        with mock.patch('storefront.pagecache.getCatalogVersion', return_value=2):
+            self.assertEqual(pages.get(request, 'test', build).content, b"page 2")
+
+        self.assertEqual(pages.stats()['test'], {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
@@ -0,0 +1,75 @@
+import heapq
+
+##
+# @brief A bounded counter which keeps track of the most frequent keys in a stream
+#
+# This is the Space-Saving algorithm. At most `capacity` keys are counted. When a
+# new key arrives and the counter is full, the key with the smallest count is
+# replaced and the new key inherits its count. The memory used therefore never
+# depends on how long the stream is. Counts can only be overestimated, by at
+# most the count of the key that was replaced (see error()), and they are exact
+# whenever the stream has no more than `capacity` distinct keys.
+class SpaceSaving():
+
+    ##
+    # @brief Create an empty counter
+    #
+    # @param capacity The maximum number of keys to count
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = dict()
+        self.errors = dict()
+        # Min-heap of (count, key). Entries whose count is out of date are
+        # skipped when popped, instead of being removed on every update.
+        self.heap = list()
+
+    def __len__(self):
+        return len(self.counts)
+
+    ##
+    # @brief Add an amount to the count of a key
+    #
+    # @param key The key to count
+    # @param amount The amount to add, which must be positive
+    def add(self, key, amount=1):
+        if key in self.counts:
+            self.counts[key] += amount
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = amount
+            self.errors[key] = 0
+        else:
+            smallest, old = self._popSmallest()
+            del self.counts[old]
+            del self.errors[old]
+            self.counts[key] = smallest + amount
+            self.errors[key] = smallest
+
+        heapq.heappush(self.heap, (self.counts[key], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _popSmallest(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    ##
+    # @brief Get the maximum amount that the count of a key may be overestimated by
+    #
+    # @param key A key returned by top()
+    # @return The maximum overestimate of the count
+    def error(self, key):
+        return self.errors.get(key, 0)
+
+    ##
+    # @brief Get the keys with the largest counts
+    #
+    # Ties are broken by the key, so the result does not depend on the order
+    # that the keys were added in.
+    #
+    # @param k The number of keys to return
+    # @return A list of (key, count) tuples, largest first
+    def top(self, k):
+        return heapq.nsmallest(k, self.counts.items(), key=lambda item: (-item[1], item[0]))
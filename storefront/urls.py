@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.HomePageView, name='home'),
@@ -7,13 +7,21 @@ urlpatterns = [
     path('analytics/sales', views.SalesPageView, name='sales'),
     path('analytics/excess', views.ExcessPageView, name='excess'),
     path('analytics/frequent', views.FrequentPageView, name='frequent'),
+    path('analytics/frequent/progress/<str:pk>', views.FrequentProgressView, name='frequent-progress'),
     path('analytics/restock', views.RestockPageView, name='restock'),
+    path('analytics/export/<str:pk>', views.ExportView, name='export'),
+    path('analytics/series', views.SeriesView, name='series'),
+    path('analytics/cache-stats', views.CacheStatsView, name='cache-stats'),
     path('menu/', views.MenuPageView.as_view(), name='menu'),  
     path('menu/menu-home', views.MenuHomePageView, name='menu-home'),
     path('menu/drinks/<str:pk>', views.DrinksPageView, name='drinks'),
     path('menu/<int:pk>/', views.ItemDetailView, name='item-detail'),
+    path('menu/<int:pk>/configure', views.ConfigureItemView, name='configure-item'),
     path('customization/<str:pk>', views.CustomizationDetailView, name='customization'),
     path('locations/', views.LocationView, name='locations'),
     path('checkout/', views.CheckoutPageView, name='checkout'),
     path('search/', views.SearchPageView, name='search'),
+    path('search/autocomplete', views.AutocompleteView, name='autocomplete'),
+    path('api/finances', api.finances, name='api-finances'),
+    path('api/reports/<str:pk>', api.report, name='api-report'),
 ]
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import CacheVersion
+
+##
+# @brief A value which is built from the DB and kept in memory until the
+# tables it was built from change
+#
+# The value is rebuilt when the CacheVersion counter with the same name
+# changes. The counter is checked at most once every CACHE_VERSION_TTL seconds,
+# so reading the value usually issues no queries at all. Changes made in this
+# process invalidate the value immediately (see signals.py).
+class Versioned():
+
+    ## Every Versioned value, by CacheVersion name
+    registry = dict()
+
+    ##
+    # @brief Create a new versioned value
+    #
+    # @param name The name of the CacheVersion counter to follow
+    # @param build A function taking no arguments which builds the value
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self.value = None
+        self.version = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        Versioned.registry.setdefault(name, list()).append(self)
+
+    ##
+    # @brief Get the value, rebuilding it if its tables changed
+    #
+    # @return The value returned by the build function
+    def get(self):
+        ttl = getattr(settings, 'CACHE_VERSION_TTL', 5)
+        if self.value is not None and time.monotonic() - self.checked < ttl:
+            return self.value
+
+        with self.lock:
+            if self.value is None or time.monotonic() - self.checked >= ttl:
+                # Read the version before building, so that changes made during
+                # the build cause another rebuild on the next check
+                version = CacheVersion.get(self.name)
+                if self.value is None or version != self.version:
+                    self.value = self.build()
+                    self.version = version
+                self.checked = time.monotonic()
+
+        return self.value
+
+    ##
+    # @brief Force the version to be checked on the next get
+    def invalidate(self):
+        self.checked = 0.0
+
+    ##
+    # @brief Record a change to the given group of tables
+    #
+    # Bumps the CacheVersion counter so that other processes reload, and
+    # invalidates the values of this process right away.
+    #
+    # @param name The name of the group of tables that changed
+    @classmethod
+    def changed(cls, name):
+        CacheVersion.bump(name)
+        for value in cls.registry.get(name, list()):
+            value.invalidate()
@@ -1,82 +1,85 @@
 """ this is the page that generates what is seen"""
 
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.views.generic import TemplateView, ListView
 from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.db.models import Q
+from django.views.decorators.http import require_POST
 from datetime import date
+import json
 
 from .models import *
-from .forms import CustomizationForm, SplashForm, MilkForm, ExtraShotForm, SyrupForm, SauceForm
-from .forms import DrizzleForm, LiningForm, ToppingForm, MixForm, FoamForm, SweetenerForm, SweetenerPacketForm
-from .forms import InclusionForm, ChaiForm, JuiceForm  
+from . import exports
+from .cart import Cart
+from .catalog import getCatalog
+from .reports import getReportCache
+from .search import getSearchIndex
+from .pagecache import getPageCache
+from .forms import CustomizationForm, customizationForm, MAX_AMOUNTS, DEFAULT_MAX_AMOUNT
 class MenuPageView(ListView):
-    model = Menu
     template_name = "menu.html"
+    extra_context = {'cached_page': True}
+
+    def get_queryset(self):
+        return getCatalog().items
+
+    def get(self, request, *args, **kwargs):
+        return getPageCache().get(request, 'menu', lambda: super(MenuPageView, self).get(request, *args, **kwargs))
 
 # @brief generates the home page
 #
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def HomePageView(request):
-    hasCart = False
-    order = SET_NULL
-    try:
-        if 'cart' in request.session:
-            order = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
-    return render(request, 'home.html', {'hasCart': hasCart, 'order':order})
+    cart = Cart(request.session)
+    return render(request, 'home.html', {'hasCart': len(cart) > 0, 'cart':cart})
 
 # @brief generates the base page for menu
 #
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def MenuHomePageView(request):
-    order = SET_NULL
-    if 'item-in-view' in request.session:
-        try:
-            OrderItem.objects.get(pk=request.session['item-in-view']).delete()
-            del request.session['item-in-view']
-        except:
-            print("It looks like the orderitem is already deleted...")
-            del request.session['item-in-view']
-
-    hasCart = False
-    try:
-        if 'cart' in request.session:
-            order = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
+    cart = Cart(request.session)
+    cart.clearView()
 
-    return render(request, 'menu-home.html', {'hasCart': hasCart, 'order':order})
+    return getPageCache().get(request, 'menu-home', lambda: render(request, 'menu-home.html', {'cached_page': True}))
 
 # @brief generates the search page
-# shows results on word(s) that are in a name/description
+# shows the drinks whose name/description has the word(s), best matches first
 #
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def SearchPageView(request):
-    order = SET_NULL
-    hasCart = False
-    try:
-        if 'cart' in request.session:
-            order = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
     q = request.GET.get('q') if request.GET.get('q') != None else ''
-    drinks = Menu.objects.filter(
-        (Q(name__icontains=q) |
-        Q(description__icontains=q)) &
-        (Q(size__iexact='grande') |
-         Q(size__iexact="doppio"))
-        
-    )
-    context = {'drinks': drinks, 'hasCart':hasCart, 'order':order}
-    return render(request,'search.html', context)
+    return getPageCache().get(request, 'search', lambda: render(request, 'search.html', {
+        'drinks': getSearchIndex().search(q), 'cached_page': True}))
+
+##
+# @brief Suggest drinks for the text typed in the search box, as JSON
+#
+# GET parameters: q, the text typed so far, and limit, the most drinks to return
+# (8 by default, at most 20). The last word of q is matched as a prefix.
+#
+# @param request The HTTP Request object from the website
+# @return A JsonResponse with a list of the id, name, image and url of each drink
+def AutocompleteView(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an int")
+
+    q = request.GET.get('q', '')
+    drinks = getSearchIndex().search(q, limit) if q.strip() != '' else list()
+    return JsonResponse({'results': [{
+        'id': drink.pk,
+        'name': drink.name,
+        'image': drink.image,
+        'url': reverse('item-detail', args=[drink.pk]),
+    } for drink in drinks]})
 
 # @brief generates the page based on the type of drink selected
 #
@@ -84,130 +87,30 @@ def SearchPageView(request):
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def DrinksPageView(request,pk):
-    order = SET_NULL
-    if 'item-in-view' in request.session:
-        try:
-            OrderItem.objects.get(pk=request.session['item-in-view']).delete()
-        except:
-            print("It looks like the orderitem is already deleted...")
-            del request.session['item-in-view']
-
-    hasCart = False
-    try:
-        if 'cart' in request.session:
-            order = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
+    cart = Cart(request.session)
+    cart.clearView()
 
-    products = Menu.objects.filter(type__iexact=pk, size__iexact="grande")
-    return render(request, 'drinks.html', {'products':products, 'hasCart':hasCart, 'name':pk, 'order':order})
+    return getPageCache().get(request, 'drinks', lambda: render(request, 'drinks.html', {
+        'products': getCatalog().ofType(pk, 'grande'), 'name': pk, 'cached_page': True}))
 
 
 def CustomizationDetailView(request, pk):
-    order = Order.objects.get(pk=request.session['cart'])
-    orderItem = OrderItem.objects.get(pk=request.session['item-in-view'])
-    customizations = Customization.objects.filter(type__iexact=pk)
-    if pk == 'milk':
-        form = MilkForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(id=value),1)
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk == 'syrup':
-        form = SyrupForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_"," ")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.filter(Q(name=name) & Q(type='syrup'))[0],float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk ==  'coffee':
-        form = ExtraShotForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk == 'sauce':
-        form = SauceForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_"," ")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.filter(Q(name=name) & Q(type='sauce'))[0],float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk ==  'drizzle':
-        form = DrizzleForm(request.POST)
-    elif pk == 'lining':
-        form = LiningForm(request.POST)
-    elif pk ==  'topping':
-        form = ToppingForm(request.POST)
-    elif pk == 'mix':
-        form = MixForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk ==  'foam':
-        form = FoamForm(request.POST)
-    elif pk == 'sweetener':
-        form = SweetenerForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk ==  'sweetener-packet':
-        form = SweetenerPacketForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk == 'inclusion':
-        form = InclusionForm(request.POST)
-    elif pk ==  'chai':
-        form = ChaiForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk == 'juice':
-        form = JuiceForm(request.POST)
-        if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    name = key.replace("_","-")
-                    if value and value != '':
-                        orderItem.addCustomization(Customization.objects.get(name=name),float(value))
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    elif pk == 'splash':
-        form = SplashForm(request.POST)
-    if request.method == 'POST':
-            if form.is_valid():
-                for key, value in form.cleaned_data.items():
-                    if value and value != '':
-                        for val in value:
-                            orderItem.addCustomization(Customization.objects.get(id=val),1)
-                return redirect('item-detail', pk=orderItem.menu_item.id)
-    return render(request, 'customization.html', {'customizations':customizations, 'name':pk, 'hasCart':True, 'order':order, 'form':form})
+    cart = Cart(request.session)
+    if cart.getView() is None:
+        return redirect('menu-home')
+    menu_item = cart.getView()[0]
+
+    form_class = customizationForm(pk)
+    if form_class is None:
+        raise Http404("No such customization type")
+
+    form = form_class(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        cart.addCustomizations(form.selected())
+        return redirect('item-detail', pk=menu_item)
+
+    customizations = getCatalog().customizationsOfType(pk)
+    return render(request, 'customization.html', {'customizations':customizations, 'name':pk, 'hasCart':len(cart) > 0, 'cart':cart, 'form':form})
 
 # @brief generates the page where the customer can see the drink and can what type of customization to add
 #
@@ -215,39 +118,20 @@ def CustomizationDetailView(request, pk):
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def ItemDetailView(request, pk):
+    catalog = getCatalog()
+    item = catalog.get(pk)
+    if item is None:
+        raise Http404("No such Menu item")
+    item_description = catalog.description(item.name)
     
-    item = Menu.objects.get(pk = pk)
-    item_description = Menu.objects.filter(Q(name=item.name) & Q(size__iexact='grande'))[0].description
-    
-    order1 = SET_NULL
-    hasCart = False
-    
-    # Create Cart if it doesn't exist
-    if 'cart' not in request.session:
-        request.session['cart'] = Order.create('user-created').pk
-    try:
-        if 'cart' in request.session:
-            order1 = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
-
-    
-
-    # Create Temporary Item Session
-    # Create if item is different than previous, or if doesn't exist
-    if 'item-in-view' not in request.session or (obj := OrderItem.objects.filter(pk=request.session['item-in-view']).first()) == None or obj.menu_item.name != item.name:
-
-        # Delete Previous Items
-        if 'item-in-view' in request.session and obj != None:
-            OrderItem.objects.get(pk=request.session['item-in-view']).delete()
-
-        order = int(request.session['cart'])
-        request.session['item-in-view'] = OrderItem.create(# Create orderItem belonging to cart
-                item).pk # Create with menu item selected
+    cart = Cart(request.session)
 
+    # Start configuring the item if it is different than the previous one, or
+    # if no item is being configured. This only changes the session.
+    view = cart.getView()
+    if view is None or (view[0] != item.pk and getattr(catalog.get(view[0]), 'name', None) != item.name):
+        cart.setView(item.pk)
 
-    orderItem = OrderItem.objects.get(pk=request.session['item-in-view'])
     size = 'grande'    
     # If it is a POST request we will process the form data
     if request.method == 'POST':
@@ -256,56 +140,140 @@ def ItemDetailView(request, pk):
         form.setSizes(item.getPossibleSizes())
         # check if the form is valid
         if form.is_valid():
-            order = int(request.session['cart'])
-            orderItem.addOrder(Order.objects.get(pk=order))
             size = form.cleaned_data['size']
-            item_name = orderItem.menu_item.name
-            item = Menu.objects.filter(size=size, name=item_name).first()
+            item = catalog.item(item.name, size)
             
-            orderItem.amount = form.cleaned_data['amount']
-            orderItem.menu_item = item 
-
-            orderItem.save()
+            cart.updateView(item.pk, form.cleaned_data['amount'] or 1)
             
             for key, value in form.cleaned_data.items():
                 if value and value != '':
                     if key[0:3] != 'amt' and key != 'size' and key != 'amount':
+                        amount = 1
                         if key != 'milk' and key != 'drizzle' and key != 'topping' and key != 'foam' and key != 'lining' and key != 'inclusion':
                             amount_string = 'amt_' + key
                             amount = form.cleaned_data[amount_string]
-                        orderItem.addCustomization(Customization.objects.get(id=value),amount)
+                        cart.addCustomization(int(value),amount)
 
             # The submit button was not pressed, this is just an update
             if not request.POST.get('a2c-btn', False):
-                print("Not submit, just reload")
-                return render(request, 'item-detail.html', {'item': item, 'form':form, 'hasCart':hasCart, 'order':order1, 'orderItem':orderItem, 'item_description':item_description})
+                return render(request, 'item-detail.html', {'item': item, 'form':form, 'hasCart':len(cart) > 0, 'cart':cart, 'orderItem':cart.getViewItem(), 'item_description':item_description, 'item_ingredients':catalog.ingredients.get(item.pk, ())})
                 
 
-            del request.session['item-in-view']
+            cart.addView()
 
-            return render(request, 'menu-home.html', {'hasCart':hasCart, 'order':order1})
+            return render(request, 'menu-home.html', {'hasCart':len(cart) > 0, 'cart':cart})
     # If method is GET create a blank form
     else:
         form = CustomizationForm()
         form.setSizes(item.getPossibleSizes())
 
         
-    return render(request, 'item-detail.html', {'item': item, 'form':form, 'hasCart':hasCart, 'order':order1, 'orderItem':orderItem,'item_description':item_description})
+    return render(request, 'item-detail.html', {'item': item, 'form':form, 'hasCart':len(cart) > 0, 'cart':cart, 'orderItem':cart.getViewItem(),'item_description':item_description, 'item_ingredients':catalog.ingredients.get(item.pk, ())})
+
+##
+# @brief Parse the configuration of an item sent to ConfigureItemView
+#
+# @param catalog The Catalog
+# @param item The Menu item being configured
+# @param data The decoded JSON body
+# @param view The current configuration from the cart, or None
+# @return A tuple of the Menu item, the amount and a list of (Customization id, amount) tuples
+# @throws ValueError If the configuration is not valid
+def _configuration(catalog, item, data, view):
+    if not isinstance(data, dict):
+        raise ValueError("The body must be a JSON object")
+
+    size = data.get('size', item.size)
+    item = catalog.item(item.name, str(size))
+    if item is None:
+        raise ValueError(f"{size} is not a size of this drink")
+
+    amount = data.get('amount', view[1] if view is not None else 1)
+    if not isinstance(amount, int) or amount < 1:
+        raise ValueError("amount must be a positive integer")
+
+    if 'customizations' not in data:
+        return item, amount, [tuple(pair) for pair in view[2]] if view is not None else list()
+
+    entries = data['customizations']
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        raise ValueError("customizations must be a list of objects")
+
+    # Customizations given by name are resolved in one batch per type
+    ids = dict()
+    for cust_type in {e.get('type') for e in entries if 'id' not in e}:
+        names = [e.get('name') for e in entries if 'id' not in e and e.get('type') == cust_type]
+        ids[cust_type] = catalog.customizationIds(names, cust_type)
+
+    custs = list()
+    for entry in entries:
+        cust = entry['id'] if 'id' in entry else ids[entry.get('type')].get(entry.get('name'))
+        if not isinstance(cust, int) or cust not in catalog.customizations:
+            raise ValueError(f"No customization {entry.get('id', entry.get('name'))}")
+
+        n = entry.get('amount', 1)
+        limit = MAX_AMOUNTS.get(catalog.customizations[cust].type.lower(), DEFAULT_MAX_AMOUNT)
+        if not isinstance(n, int) or not 1 <= n <= limit:
+            raise ValueError(f"The amount of {catalog.customizations[cust].name} must be from 1 to {limit}")
+        custs.append((cust, n))
+
+    return item, amount, custs
+
+##
+# @brief Configure the item being viewed and return it priced, as JSON
+#
+# The body is a JSON object of the whole configuration of the item, e.g.
+# {"size": "Venti", "amount": 2, "customizations": [{"id": 12, "amount": 2},
+# {"name": "Vanilla", "type": "syrup", "amount": 1}]}. Keys which are left out
+# keep their current value. The configuration replaces the one in the cart in
+# a single session write, and the item is priced from the catalog, so no other
+# queries are made.
+#
+# @param request The HTTP Request object from the website
+# @param pk The Primary Key of any size of the drink being configured
+# @return A JsonResponse of the priced item, or of the error with status 400
+@require_POST
+def ConfigureItemView(request, pk):
+    catalog = getCatalog()
+    item = catalog.get(pk)
+    if item is None:
+        raise Http404("No such Menu item")
+
+    cart = Cart(request.session)
+    view = cart.getView()
+    if view is not None and getattr(catalog.get(view[0]), 'name', None) != item.name:
+        view = None
+
+    try:
+        item, amount, custs = _configuration(catalog, item, json.loads(request.body or b'{}'), view)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    cart.configureView(item.pk, amount, custs)
+    line = cart.getViewItem()
+    return JsonResponse({
+        'id': item.pk,
+        'name': item.name,
+        'size': item.size,
+        'image': item.image,
+        'amount': line.amount,
+        'price': line.price,
+        'customizations': [{
+            'id': cust.customization.pk,
+            'name': cust.customization.name,
+            'type': cust.customization.type,
+            'amount': cust.amount,
+            'price': cust.price,
+        } for cust in line.customization_list],
+    })
 
 # @brief generates the location of the stgore on a page
 #
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def LocationView(request):
-    hasCart = False
-    order = SET_NULL
-    try:
-        if 'cart' in request.session:
-            order = Order.objects.get(pk=request.session['cart'])
-            hasCart = True
-    except:
-        print("Either no cart exists or it is invalid")
-    return render(request,'locations.html', {'hasCart': hasCart, 'order':order})
+    cart = Cart(request.session)
+    return render(request,'locations.html', {'hasCart': len(cart) > 0, 'cart':cart})
 
 @staff_member_required
 def AnalyticsPageView(request):
@@ -316,19 +284,17 @@ def AnalyticsPageView(request):
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def CheckoutPageView(request):
-    order = Order.objects.get(pk=request.session['cart'])
+    cart = Cart(request.session)
     # Remove unadded items from cart
     if request.method == 'POST':
         data = request.POST
         if "remove-id" in data:
-            item = data.get("remove-id")
-            OrderItem.objects.get(id=int(item)).delete()
+            cart.remove(int(data.get("remove-id")))
         elif "checkingout" in data:
-            order.checkout()
-            del request.session['cart']
+            cart.checkout('user-created')
             return redirect('home')
       
-    return render(request, 'checkout.html', {'order': order, 'hasCart':False})
+    return render(request, 'checkout.html', {'cart': cart, 'hasCart':False})
 
 # @brief generates the page to view the sales report
 #
@@ -336,16 +302,20 @@ def CheckoutPageView(request):
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def SalesPageView(request):
     report = ""
-    if request.method == 'POST':
-        data = request.POST
-        if "start_date" in data:
-            start_date = data.get("start_date")
-        if "end_date" in data:
-            end_date = data.get("end_date")
+    data = request.POST or request.GET
+    if "start_date" in data and "end_date" in data:
+        start_date = data.get("start_date")
+        end_date = data.get("end_date")
+        group = data.get("group", "item")
+        if group not in FinanceView.SALES_GROUPS:
+            group = "item"
+
         finances = FinanceView(start_date,end_date)
-        report = finances.salesByItem()
+        sales = getReportCache().get('sales', (group,), start_date, end_date,
+                                     lambda: list(finances.salesReport(group)))
+        report = Paginator(sales, 25).get_page(data.get("page"))
 
-    return render(request,'analytics/sales.html', {'report':report})
+    return render(request,'analytics/sales.html', {'report':report, 'query': data})
 
 # @brief generates the page to view the excess report
 #
@@ -361,7 +331,9 @@ def ExcessPageView(request):
         
         end_date = date.today()
         finances = FinanceView(start_date, end_date)
-        report = finances.excessReport(pct)
+        # The report depends on the current stock, which Inventory edits change
+        report = getReportCache().get('excess', (pct,), start_date, end_date,
+                                      lambda: list(finances.excessReport(pct)), versions=('recipes',))
 
     return render(request,'analytics/excess.html', {'report':report})
 
@@ -379,25 +351,120 @@ def FrequentPageView(request):
             end_date = data.get("end_date")
         
         limit = int(data.get('limit_amt', 100))
+        progress_key = f"frequent-progress-{data.get('progress_id', '')}"
+
+        def progress(done, total):
+            cache.set(progress_key, {'done': done, 'total': total}, 300)
 
         finances = FinanceView(start_date,end_date)
-        report = finances.sellsTogetherReportSorted(limit=limit)
+        report = getReportCache().get('frequent', (limit,), start_date, end_date,
+                                      lambda: finances.sellsTogetherTopK(limit, progress=progress if "progress_id" in data else None))
 
     return render(request,'analytics/frequent.html', {'report':report})
+
+# @brief returns the progress of a frequent report which is being generated
+#
+# @param request The HTTP Request object from the website
+# @param pk The progress_id which was posted with the report form
+# @return a JSON object with the days done and the total days, or an empty object
+def FrequentProgressView(request, pk):
+    return JsonResponse(cache.get(f"frequent-progress-{pk}", {}))
+
+# @brief streams a report or raw data as CSV or newline delimited JSON
+#
+# The report is given in the URL (see exports.EXPORTS). Its parameters, including
+# start_date and end_date, and the format ('csv' or 'ndjson') are GET parameters.
+#
+# @param request The HTTP Request object from the website
+# @param pk The name of the export
+# @return a StreamingHttpResponse of the rows, which are read from the DB as they are sent
+@staff_member_required
+def ExportView(request, pk):
+    data = request.GET
+    if pk not in exports.EXPORTS:
+        raise Http404(f"No export named {pk}")
+    if pk != 'restock' and not ("start_date" in data and "end_date" in data):
+        return HttpResponseBadRequest("start_date and end_date are required")
+    if data.get("group", "item") not in FinanceView.SALES_GROUPS:
+        return HttpResponseBadRequest("group must be one of " + ", ".join(FinanceView.SALES_GROUPS))
+
+    rows = exports.rows(pk, data)
+    if data.get("format", "csv") == "ndjson":
+        response = StreamingHttpResponse(exports.ndjson(rows), content_type="application/x-ndjson")
+        extension = "ndjson"
+    else:
+        response = StreamingHttpResponse(exports.csvLines(exports.columns(pk, data), rows), content_type="text/csv")
+        extension = "csv"
+
+    response['Content-Disposition'] = f'attachment; filename="{pk}.{extension}"'
+    return response
+
+# @brief returns the sales, revenue and inventory usage of each hour, day, week or month
+#
+# Takes the GET parameters start_date, end_date and bucket (hour, day, week or month).
+#
+# @param request The HTTP Request object from the website
+# @return a JSON object with a 'sales' list of buckets, and the 'usage' of each
+# Inventory item in each bucket
+@staff_member_required
+def SeriesView(request):
+    data = request.GET
+    bucket = data.get("bucket", "day")
+    if not ("start_date" in data and "end_date" in data):
+        return HttpResponseBadRequest("start_date and end_date are required")
+    if bucket not in FinanceView.BUCKETS:
+        return HttpResponseBadRequest("bucket must be one of " + ", ".join(FinanceView.BUCKETS))
+
+    finances = FinanceView(data.get("start_date"), data.get("end_date"))
+
+    def build():
+        buckets, inventory, usage = finances.usageSeries(bucket)
+        names = dict(Inventory.objects.filter(id__in=inventory.tolist()).values_list('id', 'name'))
+        return {
+            'bucket': bucket,
+            'sales': finances.salesSeries(bucket),
+            'usage': {
+                'buckets': buckets,
+                'inventory': [{'id': i, 'name': names.get(i)} for i in inventory.tolist()],
+                'amounts': usage.tolist(),
+            },
+        }
+
+    return JsonResponse(getReportCache().get('series', (bucket,), finances.start_date, finances.end_date, build))
+
 # @brief generates the page to view the restock report
 #
 # @param request The HTTP Request object from the website
 # @return a render based on the reqeust, home.html, and a hash which is passed into the html
 def RestockPageView(request):
     report = ""
+    forecast = ""
     if request.method == 'POST':
         data = request.POST
         limit = int(data.get('limit_amt', 100))
-        start_date = "2022-12-10"
-        end_date = date.today()
-
-        finances = FinanceView(start_date,end_date)
-        report = finances.restockReport(limit)
 
-
-    return render(request,'analytics/restock.html', {'report':report})
+        if data.get('mode') == 'forecast':
+            # The history is the complete days before today, and the forecast starts today
+            history = max(int(data.get('history_days', 56)), 1)
+            end_date = deltaDate(date.today(), -1)
+            start_date = deltaDate(end_date, 1 - history)
+            params = (history, int(data.get('window', 28)), int(data.get('lead_days', 7)), int(data.get('cover_days', 14)))
+
+            finances = FinanceView(start_date, end_date)
+            forecast = getReportCache().get('forecast', params, start_date, date.today(),
+                                            lambda: finances.forecastReport(*params[1:]), versions=('recipes',))
+        else:
+            finances = FinanceView(date.today(), date.today())
+            # The report only depends on the current stock, which every checkout changes
+            report = getReportCache().get('restock', (limit,), None, None,
+                                          lambda: list(finances.restockReport(limit)), versions=('recipes',))
+
+    return render(request,'analytics/restock.html', {'report':report, 'forecast':forecast})
+
+# @brief returns the hit and miss counters of the page and report caches of this process
+#
+# @param request The HTTP Request object from the website
+# @return a JSON object with the 'pages' stats of each cached page and the 'reports' stats
+@staff_member_required
+def CacheStatsView(request):
+    return JsonResponse({'pages': getPageCache().stats(), 'reports': getReportCache().stats()})